@@ -1,59 +1,82 @@
 from fastapi import HTTPException, Request
-from typing import Optional
+from typing import NamedTuple, Optional
 from datetime import datetime, timezone, timedelta
 import os
 import uuid
-from motor.motor_asyncio import AsyncIOMotorClient
-import aiohttp
+import asyncio
+import logging
 from dotenv import load_dotenv
 from pathlib import Path
 from models import User, UserSession, SUPER_ADMIN_EMAILS, is_super_admin
+from database import get_mongo
+from cache import LRUTTLCache
+from token_versions import token_versions
+from emergent_auth import emergent_auth_client
+from serialization import trusted
 from passlib.context import CryptContext
+from hashing import PasswordHasher, PasswordHashPoolBusy
 from jose import JWTError, jwt
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(pwd_context)
+# Strong references to fire-and-forget rehash tasks
+_rehash_tasks = set()
+
+logger = logging.getLogger(__name__)
 SECRET_KEY = os.environ.get("SECRET_KEY", "ylm-sozluk-secret-key-2024")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 7
+TEACHER_ROLES = ["teacher", "super_admin"]
+
+# Users resolved from JWTs, keyed by token subject (email). Invalidation is
+# per process; entries also remember the user's token version, so a role or
+# subscription change made on another worker drops them once token_versions
+# refreshes, and the TTL bounds any other staleness.
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "30"))
+user_cache = LRUTTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS, name="users")
+
+# Cookie/OAuth sessions: session_token -> (User, expires_at, token version).
+# Logout deletes the session on one worker only, so the TTL is how long a
+# logged-out token keeps working elsewhere.
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL_SECONDS = float(os.environ.get("SESSION_CACHE_TTL_SECONDS", "5"))
+session_cache = LRUTTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL_SECONDS, name="sessions")
+
+# Bumped by invalidate_cached_user; with token_versions.generation it tells a
+# cache fill whether the user may have changed while its read was in flight
+_invalidations = 0
+
+def _cache_generation() -> tuple:
+    return _invalidations, token_versions.generation
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
-AUTH_API_URL = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
-
 async def get_session_data(session_id: str) -> dict:
     """Get user data from Emergent Auth API"""
-    headers = {"X-Session-ID": session_id}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(AUTH_API_URL, headers=headers) as response:
-            if response.status != 200:
-                raise HTTPException(status_code=401, detail="Invalid session ID")
-            return await response.json()
+    return await emergent_auth_client.get_session_data(session_id)
 
 async def create_or_update_user(auth_data: dict) -> User:
     """Create new user or update existing user"""
+    db = get_mongo()
     email = auth_data["email"]
     
     # Check if user exists
     existing_user = await db.users.find_one({"email": email}, {"_id": 0})
     
     if existing_user:
-        # Update existing user
-        user = User(**existing_user)
-        # Update name and picture if changed
-        await db.users.update_one(
-            {"email": email},
-            {"$set": {
-                "name": auth_data["name"],
-                "picture": auth_data["picture"]
-            }}
-        )
+        # Update name and picture if changed; cached copies only go stale then
+        changes = {
+            field: auth_data[field] for field in ("name", "picture")
+            if existing_user.get(field) != auth_data[field]
+        }
+        if changes:
+            await db.users.update_one({"email": email}, {"$set": changes})
+            existing_user.update(changes)
+            invalidate_cached_user(existing_user["user_id"])
+        user = trusted(User, existing_user)
     else:
         # Create new user
         user_id = f"user_{uuid.uuid4().hex[:12]}"
@@ -83,13 +106,14 @@ async def create_or_update_user(auth_data: dict) -> User:
 
 async def create_session(user_id: str, session_token: str) -> UserSession:
     """Create new session in database"""
+    db = get_mongo()
     # Check if session already exists
     existing_session = await db.user_sessions.find_one({"session_token": session_token}, {"_id": 0})
     if existing_session:
         return UserSession(**existing_session)
     
-    # Create new session
-    expires_at = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=7)
+    # Create new session; expires_at must be a BSON date for the TTL index
+    expires_at = datetime.now(timezone.utc) + timedelta(days=7)
     session_data = {
         "user_id": user_id,
         "session_token": session_token,
@@ -100,51 +124,86 @@ async def create_session(user_id: str, session_token: str) -> UserSession:
     await db.user_sessions.insert_one(session_data)
     return UserSession(**session_data)
 
-async def get_current_user(request: Request) -> Optional[User]:
-    """Get current user from session token or JWT"""
-    # Try JWT token from Authorization header first
+# Marks that request.state holds no resolved user yet (None is a cached negative result)
+_UNRESOLVED = object()
+
+def _read_credentials(request: Request):
+    """Single pass over the Authorization header and session cookie"""
+    bearer = None
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ")[1]
-        user = await get_current_user_from_token(token)
+        bearer = auth_header[len("Bearer "):].strip() or None
+    return bearer, request.cookies.get("session_token")
+
+async def get_current_user(request: Request) -> Optional[User]:
+    """Get current user from session token or JWT, resolved at most once per request"""
+    user = getattr(request.state, "auth_user", _UNRESOLVED)
+    if user is _UNRESOLVED:
+        user = await _resolve_user(request)
+        request.state.auth_user = user
+    return user
+
+async def _resolve_user(request: Request) -> Optional[User]:
+    bearer, session_token = _read_credentials(request)
+    
+    # Try JWT token from Authorization header first
+    is_jwt = bearer is not None and bearer.count(".") == 2
+    if is_jwt:
+        user = await get_current_user_from_token(bearer)
         if user:
             return user
     
-    # Try cookie
-    session_token = request.cookies.get("session_token")
-    
-    # Fallback to Authorization header
-    if not session_token:
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            session_token = auth_header.replace("Bearer ", "")
+    # Fallback to a session token sent as bearer; JWT-shaped strings never are one
+    if not session_token and not is_jwt:
+        session_token = bearer
     
     if not session_token:
         return None
+    return await get_user_from_session(session_token)
+
+async def get_user_from_session(session_token: str) -> Optional[User]:
+    """Resolve a session token to its user: cache hit, else one $lookup round trip"""
+    now = datetime.now(timezone.utc)
+    cached = session_cache.get(session_token)
+    if cached is not None:
+        user, expires_at, version = cached
+        if expires_at <= now:
+            session_cache.pop(session_token)
+            return None
+        if version == token_versions.current(user.user_id):
+            return user
+        # Role or subscription changed on some worker since this was cached
+        session_cache.pop(session_token)
     
-    # Find session in database
-    session_doc = await db.user_sessions.find_one({"session_token": session_token}, {"_id": 0})
-    if not session_doc:
+    # Find unexpired session and its user; expired ones are removed by the TTL index
+    generation = _cache_generation()
+    db = get_mongo()
+    docs = await db.user_sessions.aggregate([
+        {"$match": {"session_token": session_token, "expires_at": {"$gt": now}}},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "user_id",
+            "as": "user"
+        }},
+        {"$unwind": "$user"},
+        {"$project": {"_id": 0, "user._id": 0}}
+    ]).to_list(1)
+    if not docs:
         return None
     
-    # Check expiration
-    expires_at = session_doc["expires_at"]
-    if isinstance(expires_at, str):
-        expires_at = datetime.fromisoformat(expires_at)
+    user = trusted(User, docs[0]["user"])
+    expires_at = docs[0]["expires_at"]
     if expires_at.tzinfo is None:
         expires_at = expires_at.replace(tzinfo=timezone.utc)
-    
-    if expires_at < datetime.now(timezone.utc):
-        # Delete expired session
-        await db.user_sessions.delete_one({"session_token": session_token})
-        return None
-    
-    # Get user
-    user_doc = await db.users.find_one({"user_id": session_doc["user_id"]}, {"_id": 0})
-    if not user_doc:
-        return None
-    
-    return User(**user_doc)
+    if _cache_generation() == generation:
+        # Otherwise the user may have changed during the read; serve it uncached
+        session_cache.set(session_token, (user, expires_at, token_versions.current(user.user_id)), tag=user.user_id)
+    return user
+
+def invalidate_session(session_token: str):
+    session_cache.pop(session_token)
 
 async def require_auth(request: Request) -> User:
     """Require authentication - raise exception if not authenticated"""
@@ -153,30 +212,86 @@ async def require_auth(request: Request) -> User:
         raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
-async def require_teacher(request: Request) -> User:
+def get_token_claims(request: Request) -> Optional[dict]:
+    """Verified role/subscription claims of the bearer JWT, or None if absent or revoked"""
+    claims = getattr(request.state, "auth_claims", _UNRESOLVED)
+    if claims is _UNRESOLVED:
+        claims = _verify_claims(request)
+        request.state.auth_claims = claims
+    return claims
+
+def _verify_claims(request: Request) -> Optional[dict]:
+    bearer, _ = _read_credentials(request)
+    if bearer is None or bearer.count(".") != 2:
+        return None
+    try:
+        payload = jwt.decode(bearer, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if any(claim not in payload for claim in ("uid", "role", "plan", "ver")):
+        return None  # Token issued before claims existed
+    if payload["ver"] != token_versions.current(payload["uid"]):
+        return None  # Role or subscription changed since the token was issued
+    return payload
+
+class Principal(NamedTuple):
+    """Who is calling, as far as authorization needs to know; call require_auth for the full User"""
+    user_id: str
+    role: str
+    subscription: str
+
+async def _require_role(request: Request, roles: list, detail: str) -> Principal:
+    principal = await _principal(request)
+    if principal.role not in roles:
+        raise HTTPException(status_code=403, detail=detail)
+    return principal
+
+async def require_teacher(request: Request) -> Principal:
     """Require teacher or admin role"""
-    user = await require_auth(request)
-    if user.role not in ["teacher", "super_admin"]:
-        raise HTTPException(status_code=403, detail="Teacher access required")
-    return user
+    return await _require_role(request, TEACHER_ROLES, "Teacher access required")
 
-async def require_super_admin(request: Request) -> User:
+async def require_super_admin(request: Request) -> Principal:
     """Require super admin role"""
+    return await _require_role(request, ["super_admin"], "Super admin access required")
+
+async def _principal(request: Request) -> Principal:
+    claims = get_token_claims(request)
+    if claims is not None:
+        # Decided from verified claims alone, without loading the user
+        return Principal(claims["uid"], claims["role"], claims["plan"])
     user = await require_auth(request)
-    if user.role != "super_admin":
-        raise HTTPException(status_code=403, detail="Super admin access required")
-    return user
+    return Principal(user.user_id, user.role, user.subscription)
+
+async def require_subscription(request: Request, plans: list, detail: str, allow_roles: tuple = ()) -> Principal:
+    """Require one of the given subscriptions, decided from token claims when possible"""
+    principal = await _principal(request)
+    if principal.subscription not in plans and principal.role not in allow_roles:
+        raise HTTPException(status_code=403, detail=detail)
+    return principal
 
 
 # ==================== JWT TOKEN FUNCTIONS ====================
 
-def verify_password(plain_password, hashed_password):
-    """Verify a password against a hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+def _password_pool_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, please retry",
+        headers={"Retry-After": "1"}
+    )
 
-def get_password_hash(password):
-    """Hash a password"""
-    return pwd_context.hash(password)
+async def verify_password(plain_password, hashed_password):
+    """Verify a password against a hash on the hashing pool"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHashPoolBusy:
+        raise _password_pool_busy()
+
+async def get_password_hash(password):
+    """Hash a password on the hashing pool"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHashPoolBusy:
+        raise _password_pool_busy()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
@@ -189,14 +304,47 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_token(user_id: str, email: str, role: str, subscription: str) -> str:
+    """Create JWT carrying the claims needed for DB-free authorization"""
+    return create_access_token(data={
+        "sub": email,
+        "uid": user_id,
+        "role": role,
+        "plan": subscription,
+        "ver": token_versions.current(user_id)
+    })
+
 async def authenticate_user(email: str, password: str):
     """Authenticate user with email and password"""
+    db = get_mongo()
     user_doc = await db.users.find_one({"email": email}, {"_id": 0})
     if not user_doc:
         return False
-    if not verify_password(password, user_doc.get("hashed_password", "")):
+    hashed_password = user_doc.get("hashed_password")
+    if not hashed_password or not await verify_password(password, hashed_password):
         return False
-    return User(**user_doc)
+    if password_hasher.needs_update(hashed_password):
+        task = asyncio.create_task(_rehash_password(user_doc["user_id"], password, hashed_password))
+        _rehash_tasks.add(task)
+        task.add_done_callback(_rehash_tasks.discard)
+    return trusted(User, user_doc)
+
+async def _rehash_password(user_id: str, password: str, old_hash: str):
+    """Upgrade a stored hash to the current bcrypt cost after a successful login"""
+    try:
+        new_hash = await password_hasher.hash(password)
+    except PasswordHashPoolBusy:
+        return  # Try again on a later login
+    db = get_mongo()
+    # Only replace the hash we verified, so a concurrent password change wins
+    result = await db.users.update_one(
+        {"user_id": user_id, "hashed_password": old_hash},
+        {"$set": {"hashed_password": new_hash}}
+    )
+    if result.modified_count:
+        password_hasher.rehashed += 1
+    else:
+        logger.info(f"Skipped rehash for {user_id}: password changed meanwhile")
 
 async def get_current_user_from_token(token: str) -> Optional[User]:
     """Get user from JWT token"""
@@ -208,8 +356,33 @@ async def get_current_user_from_token(token: str) -> Optional[User]:
     except JWTError:
         return None
     
+    cached = user_cache.get(email)
+    if cached is not None:
+        user, version = cached
+        if version == token_versions.current(user.user_id):
+            return user
+        # Role or subscription changed on some worker since this was cached
+        user_cache.pop(email)
+    
+    generation = _cache_generation()
+    # Tokens with claims name the user, so its version can be read before the query
+    version = token_versions.current(payload["uid"]) if "uid" in payload else None
+    db = get_mongo()
     user_doc = await db.users.find_one({"email": email}, {"_id": 0})
     if user_doc is None:
         return None
-    return User(**user_doc)
+    user = trusted(User, user_doc)
+    if _cache_generation() == generation:
+        # Otherwise the user may have changed during the read; serve it uncached
+        if version is None or payload["uid"] != user.user_id:
+            version = token_versions.current(user.user_id)
+        user_cache.set(email, (user, version), tag=user.user_id)
+    return user
+
+def invalidate_cached_user(user_id: str):
+    """Drop a user from the JWT and session caches after its document changed"""
+    global _invalidations
+    _invalidations += 1
+    user_cache.pop_tag(user_id)
+    session_cache.pop_tag(user_id)
 
@@ -0,0 +1,76 @@
+"""Per-row cost of the read-path serialization strategies
+
+    python bench_serialization.py [rows]
+
+Compares validating models and encoding them the way FastAPI does by
+default against model_construct and against raw dicts through orjson.
+"""
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from fastapi.encoders import jsonable_encoder
+from models import User, Word
+from serialization import dumps, trusted
+
+
+def make_words(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [{
+        "word_id": f"word_{uuid.uuid4().hex[:12]}",
+        "turkish": f"kelime {i}",
+        "russian": f"слово {i}",
+        "pronunciation": f"kelime {i}",
+        "example_tr": "Bu bir örnek cümledir.",
+        "example_ru": "Это пример предложения.",
+        "image_url": "https://images.unsplash.com/photo-1456513080510-7bf3a84b82f8?w=400",
+        "level": "A1",
+        "category_id": f"cat_{i % 40}",
+        "created_by": "user_admin",
+        "created_at": now,
+        "ai_generated": False
+    } for i in range(n)]
+
+
+def make_users(n: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [{
+        "user_id": f"user_{uuid.uuid4().hex[:12]}",
+        "email": f"student{i}@example.com",
+        "name": f"Student {i}",
+        "role": "student",
+        "subscription": "free",
+        "created_at": now,
+        "words_learned": i % 300
+    } for i in range(n)]
+
+
+def timed(label: str, rows: int, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<42} {elapsed / rows * 1e6:8.2f} us/row")
+    return elapsed
+
+
+def main(rows: int):
+    words = make_words(rows)
+    users = make_users(rows)
+
+    print(f"Word rows ({rows}):")
+    before = timed("validate + jsonable_encoder + json.dumps", rows,
+                   lambda: json.dumps(jsonable_encoder([Word(**w) for w in words])).encode())
+    timed("model_construct + jsonable_encoder + dumps", rows,
+          lambda: json.dumps(jsonable_encoder([trusted(Word, w) for w in words])).encode())
+    after = timed("raw dicts + serialization.dumps", rows, lambda: dumps(words))
+    print(f"  speedup: {before / after:.1f}x")
+
+    print(f"User rows ({rows}):")
+    before = timed("User(**doc)", rows, lambda: [User(**u) for u in users])
+    after = timed("trusted(User, doc)", rows, lambda: [trusted(User, u) for u in users])
+    print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
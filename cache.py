@@ -0,0 +1,81 @@
+"""In-process caches shared by the API modules"""
+from typing import Any, Hashable, Optional
+import threading
+from cachetools import TTLCache
+
+
+class LRUTTLCache:
+    """Bounded LRU cache whose entries also expire after a fixed TTL, with hit/miss counters
+
+    Entries may carry a tag (e.g. a user_id) so every entry derived from the
+    same record can be dropped at once with pop_tag().
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        self.name = name
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._tags = {}
+        self._tagged_keys = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, tag: Optional[Hashable] = None):
+        with self._lock:
+            self._cache[key] = (value, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+                self._tagged_keys += 1
+                if self._tagged_keys > 2 * self._cache.maxsize:
+                    self._rebuild_tags()
+
+    def _rebuild_tags(self):
+        # Keys evicted by LRU/TTL linger in the tag index until it is rebuilt
+        self._tags = {}
+        for key, (_, tag) in self._cache.items():
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+        self._tagged_keys = sum(len(keys) for keys in self._tags.values())
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            if self._cache.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def pop_tag(self, tag: Hashable):
+        """Drop every entry stored with this tag"""
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                entry = self._cache.get(key)
+                if entry is not None and entry[1] == tag:
+                    del self._cache[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._tags = {}
+            self._tagged_keys = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": int(self._cache.maxsize),
+                "ttl_seconds": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,267 @@
+"""Category catalogue and word page caches with version-based invalidation
+
+Every write that changes what /api/categories or /api/words returns bumps a
+monotonically increasing version stored in the meta collection. Workers poll
+it every CATALOGUE_VERSION_POLL_SECONDS and keep serialized (and, for word
+pages, precompressed) bodies until the version moves, so reads and
+If-None-Match revalidations need no query and no serialization work.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+from fastapi import Request, Response
+from pymongo import ReturnDocument
+from cache import LRUTTLCache
+from database import MongoDatabase
+from pagination import keyset_page, WORD_KEYSET
+from serialization import dumps
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_VERSION_POLL_SECONDS = float(os.environ.get("CATALOGUE_VERSION_POLL_SECONDS", "2"))
+CATALOGUE_META_ID = "catalogue"
+WORD_PAGE_CACHE_SIZE = int(os.environ.get("WORD_PAGE_CACHE_SIZE", "2000"))
+# Bodies smaller than this are not worth a Content-Encoding
+COMPRESS_MIN_BYTES = 512
+# Near the ratio of the maximum levels at a fraction of the CPU
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def compress_variants(body: bytes) -> Dict[str, bytes]:
+    """Content-Encoding -> compressed body; CPU-bound, run it on an executor"""
+    encoded = {}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoded["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        if brotli is not None:
+            encoded["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return encoded
+
+
+class CachedPayload:
+    """Serialized response body tagged with the catalogue version it was built from"""
+
+    def __init__(self, version: int, body: bytes, encoded: Optional[Dict[str, bytes]] = None):
+        self.version = version
+        self.body = body
+        self.etag = f'"{version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+        # Content-Encoding -> compressed body, built once per version
+        self.encoded = encoded or {}
+
+    def variant(self, request: Request):
+        """(encoding, body, etag) for the best encoding the client accepts"""
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        for encoding in ("br", "gzip"):
+            if encoding in self.encoded and accepted.get(encoding, 0) > 0:
+                # Each representation needs its own strong validator
+                return encoding, self.encoded[encoding], self.etag[:-1] + f'-{encoding}"'
+        return None, self.body, self.etag
+
+
+def _accepted_encodings(header: str) -> dict:
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in [tag.strip() for tag in header.split(",")]
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+class Catalogue:
+    """Tracks the catalogue version and caches the serialized category list"""
+
+    def __init__(self):
+        self.version = 0
+        self._categories: Optional[CachedPayload] = None
+        # Entries are revalidated against the version, the TTL only bounds idle memory
+        self._word_pages = LRUTTLCache(maxsize=WORD_PAGE_CACHE_SIZE, ttl=3600, name="word_pages")
+        # (page key, version) -> page being built, shared by concurrent misses
+        self._building: Dict[tuple, asyncio.Future] = {}
+        self.coalesced = 0
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _observe(self, version: int):
+        self.version = max(self.version, version)
+
+    async def bump(self, db: MongoDatabase, word_ids: Iterable[str] = (),
+                   category_ids: Iterable[str] = ()) -> int:
+        """Record a catalogue change; call after the write has been applied
+
+        The touched ids go to the catalogue_changes log so dictionary snapshots
+        can reload only those documents.
+        """
+        doc = await db.meta.find_one_and_update(
+            {"_id": CATALOGUE_META_ID},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        version = doc["version"]
+        try:
+            await db.catalogue_changes.insert_one({
+                "version": version,
+                "word_ids": [w for w in word_ids if w],
+                "category_ids": [c for c in category_ids if c],
+                "created_at": datetime.now(timezone.utc)
+            })
+        except Exception as e:
+            # A missing entry only costs readers a full reload
+            logger.warning(f"Catalogue change {version} not logged: {e}")
+        self._observe(version)
+        return version
+
+    async def changes_since(self, db: MongoDatabase, since: int, target: int) -> Optional[tuple]:
+        """(word_ids, category_ids) changed in (since, target]; None if the log has gaps"""
+        changes = await db.catalogue_changes.find(
+            {"version": {"$gt": since, "$lte": target}},
+            {"_id": 0, "version": 1, "word_ids": 1, "category_ids": 1}
+        ).to_list(None)
+        if len({change["version"] for change in changes}) != target - since:
+            return None
+        word_ids = {w for change in changes for w in change.get("word_ids", [])}
+        category_ids = {c for change in changes for c in change.get("category_ids", [])}
+        return word_ids, category_ids
+
+    async def refresh_version(self, db: MongoDatabase):
+        doc = await db.meta.find_one({"_id": CATALOGUE_META_ID})
+        if doc:
+            self._observe(doc["version"])
+
+    async def categories(self, db: MongoDatabase) -> CachedPayload:
+        cached = self._categories
+        if cached is not None and cached.version == self.version:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        # Capture the version before reading so a concurrent bump forces another reload
+        version = self.version
+        docs = await db.categories.find({}, {"_id": 0}).to_list(1000)
+        cached = CachedPayload(version, dumps(docs))
+        self._categories = cached
+        return cached
+
+    async def word_page(self, db: MongoDatabase, category_id: str, cursor: Optional[str],
+                        limit: int) -> CachedPayload:
+        """One /words page of a category, serialized and compressed once per version"""
+        key = (category_id, cursor, limit)
+        cached = self._word_pages.get(key)
+        if cached is not None and cached.version == self.version:
+            return cached
+        version = self.version
+        build_key = (key, version)
+        building = self._building.get(build_key)
+        if building is None:
+            # A task of its own, so a client disconnecting does not fail the other waiters
+            building = asyncio.ensure_future(self._build_word_page(db, key, version))
+            self._building[build_key] = building
+            building.add_done_callback(lambda _: self._building.pop(build_key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(building)
+
+    async def _build_word_page(self, db: MongoDatabase, key: tuple, version: int) -> CachedPayload:
+        category_id, cursor, limit = key
+        page = await keyset_page(db.words, {"category_id": category_id}, WORD_KEYSET, limit, cursor, {"_id": 0})
+        body = dumps({
+            "words": page["items"],
+            "next_cursor": page["next_cursor"],
+            "has_more": page["has_more"]
+        })
+        encoded = await asyncio.get_running_loop().run_in_executor(None, compress_variants, body)
+        cached = CachedPayload(version, body, encoded)
+        self._word_pages.set(key, cached)
+        return cached
+
+    async def _poll_loop(self, db: MongoDatabase):
+        while True:
+            await asyncio.sleep(CATALOGUE_VERSION_POLL_SECONDS)
+            try:
+                await self.refresh_version(db)
+            except Exception as e:
+                logger.warning(f"Catalogue version poll failed: {e}")
+
+    async def start(self, db: MongoDatabase):
+        await self.refresh_version(db)
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "categories_hits": self.hits,
+            "categories_misses": self.misses,
+            "not_modified": self.not_modified,
+            "word_pages": self._word_pages.stats(),
+            "word_pages_coalesced": self.coalesced
+        }
+
+
+catalogue = Catalogue()
+
+
+async def categories_response(request: Request, db: MongoDatabase) -> Response:
+    """Cached /categories body with a strong ETag; 304 when the client copy is current"""
+    payload = await catalogue.categories(db)
+    if etag_matches(request, payload.etag):
+        catalogue.not_modified += 1
+        return not_modified(payload.etag)
+    return Response(
+        content=payload.body,
+        media_type="application/json",
+        headers={"ETag": payload.etag, "Cache-Control": "no-cache"}
+    )
+
+
+async def word_page_response(request: Request, db: MongoDatabase, category_id: str,
+                             cursor: Optional[str], limit: int) -> Response:
+    """Cached /words page in the best Content-Encoding the client accepts"""
+    payload = await catalogue.word_page(db, category_id, cursor, limit)
+    encoding, body, etag = payload.variant(request)
+    if etag_matches(request, etag):
+        catalogue.not_modified += 1
+        response = not_modified(etag)
+    else:
+        response = Response(content=body, media_type="application/json",
+                            headers={"ETag": etag, "Cache-Control": "no-cache"})
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
@@ -0,0 +1,210 @@
+"""Shared MongoDB connection pool and data-access layer for YLM Sözlük"""
+from typing import Optional
+from pathlib import Path
+import os
+import threading
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Pool sizing (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Count connection pool events so the pool can be sized from real traffic"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checkouts_started = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failures = 0
+        self.checkout_timeouts = 0
+        self.pool_clears = 0
+
+    def _inc(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._inc("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._inc("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._inc("connections_closed")
+
+    def connection_check_out_started(self, event):
+        self._inc("checkouts_started")
+
+    def connection_check_out_failed(self, event):
+        self._inc("checkout_failures")
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            self._inc("checkout_timeouts")
+
+    def connection_checked_out(self, event):
+        self._inc("checked_out")
+
+    def connection_checked_in(self, event):
+        self._inc("checked_in")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "open_connections": self.connections_created - self.connections_closed,
+                "in_use": self.checked_out - self.checked_in,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "checkouts": self.checked_out,
+                "checkout_failures": self.checkout_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "pool_clears": self.pool_clears
+            }
+
+
+class MongoDatabase:
+    """App-owned Motor client with per-collection handles"""
+
+    def __init__(
+        self,
+        mongo_url: str,
+        db_name: str,
+        max_pool_size: int = MONGO_MAX_POOL_SIZE,
+        min_pool_size: int = MONGO_MIN_POOL_SIZE,
+        wait_queue_timeout_ms: int = MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    ):
+        self.pool_listener = PoolStatsListener()
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.client = AsyncIOMotorClient(
+            mongo_url,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            waitQueueTimeoutMS=wait_queue_timeout_ms,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            event_listeners=[self.pool_listener],
+        )
+        self.database = self.client[db_name]
+        self.name = db_name
+        self._collections = {}
+
+    def collection(self, name: str):
+        """Get a cached handle for a collection"""
+        handle = self._collections.get(name)
+        if handle is None:
+            handle = self.database[name]
+            self._collections[name] = handle
+        return handle
+
+    def __getitem__(self, name: str):
+        return self.collection(name)
+
+    @property
+    def users(self):
+        return self.collection("users")
+
+    @property
+    def user_sessions(self):
+        return self.collection("user_sessions")
+
+    @property
+    def user_progress(self):
+        return self.collection("user_progress")
+
+    @property
+    def words(self):
+        return self.collection("words")
+
+    @property
+    def categories(self):
+        return self.collection("categories")
+
+    @property
+    def token_versions(self):
+        return self.collection("token_versions")
+
+    @property
+    def login_buckets(self):
+        return self.collection("login_buckets")
+
+    @property
+    def meta(self):
+        return self.collection("meta")
+
+    @property
+    def catalogue_changes(self):
+        return self.collection("catalogue_changes")
+
+    @property
+    def migrations(self):
+        return self.collection("migrations")
+
+    def pool_stats(self) -> dict:
+        """Pool configuration plus live connection counters"""
+        return {
+            "max_pool_size": self.max_pool_size,
+            "min_pool_size": self.min_pool_size,
+            "wait_queue_timeout_ms": self.wait_queue_timeout_ms,
+            **self.pool_listener.snapshot()
+        }
+
+    def close(self):
+        self.client.close()
+
+
+_mongo: Optional[MongoDatabase] = None
+
+
+def connect_to_mongo(mongo_url: Optional[str] = None, db_name: Optional[str] = None) -> MongoDatabase:
+    """Create the shared client (idempotent)"""
+    global _mongo
+    if _mongo is None:
+        _mongo = MongoDatabase(
+            mongo_url or os.environ['MONGO_URL'],
+            db_name or os.environ['DB_NAME']
+        )
+    return _mongo
+
+
+def close_mongo_connection():
+    global _mongo
+    if _mongo is not None:
+        _mongo.close()
+        _mongo = None
+
+
+def get_mongo() -> MongoDatabase:
+    """Shared database for code running outside a request (auth helpers, jobs)"""
+    if _mongo is None:
+        return connect_to_mongo()
+    return _mongo
+
+
+async def get_db() -> MongoDatabase:
+    """FastAPI dependency returning the shared database"""
+    return get_mongo()
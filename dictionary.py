@@ -0,0 +1,141 @@
+"""In-process, read-only snapshot of the words and categories collections
+
+The dictionary is only a few thousand documents, so join-heavy endpoints
+look words and categories up here instead of issuing one find_one per row.
+The snapshot follows the catalogue version: when it moves, only the ids
+recorded in catalogue_changes are re-read, and a gap in that log (expired
+entries, a failed log write) falls back to a full reload.
+
+Documents handed out are shared between requests and must not be mutated.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+from catalogue import catalogue
+from database import MongoDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def _deep_sizeof(value, seen: set) -> int:
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in value)
+    return size
+
+
+class DictionarySnapshot:
+    """Words and categories indexed by id, swapped atomically on reload"""
+
+    def __init__(self):
+        self.version = -1
+        self.words_by_id: Dict[str, dict] = {}
+        self.categories_by_id: Dict[str, dict] = {}
+        self.words_by_category: Dict[str, List[str]] = {}
+        self._lock = asyncio.Lock()
+        self.full_reloads = 0
+        self.incremental_reloads = 0
+        self.last_reload_ms = 0.0
+
+    def word(self, word_id: str) -> Optional[dict]:
+        return self.words_by_id.get(word_id)
+
+    def category(self, category_id: str) -> Optional[dict]:
+        return self.categories_by_id.get(category_id)
+
+    def category_words(self, category_id: str) -> List[dict]:
+        words = self.words_by_id
+        return [words[word_id] for word_id in self.words_by_category.get(category_id, ())]
+
+    def seed(self, version: int, words: Dict[str, dict], categories: Dict[str, dict]):
+        """Start from known contents so the next reload can be incremental"""
+        self._swap(words, categories)
+        self.version = version
+
+    async def current(self, db: MongoDatabase) -> "DictionarySnapshot":
+        """The snapshot, reloaded first if the catalogue version has moved"""
+        if self.version != catalogue.version:
+            async with self._lock:
+                if self.version != catalogue.version:
+                    await self._reload(db)
+        return self
+
+    async def _reload(self, db: MongoDatabase):
+        started = time.perf_counter()
+        # Captured before reading so a concurrent bump triggers another reload
+        target = catalogue.version
+        if self.version < 0 or not await self._apply_changes(db, target):
+            await self._load_all(db)
+            self.full_reloads += 1
+        else:
+            self.incremental_reloads += 1
+        self.version = target
+        self.last_reload_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    async def _load_all(self, db: MongoDatabase):
+        words = await db.words.find({}, {"_id": 0}).to_list(None)
+        categories = await db.categories.find({}, {"_id": 0}).to_list(None)
+        self._swap(
+            {w["word_id"]: w for w in words if "word_id" in w},
+            {c["category_id"]: c for c in categories if "category_id" in c}
+        )
+
+    async def _apply_changes(self, db: MongoDatabase, target: int) -> bool:
+        """Re-read the ids changed since self.version; False if the log has gaps"""
+        changed = await catalogue.changes_since(db, self.version, target)
+        if changed is None:
+            return False
+        word_ids, category_ids = changed
+
+        words = dict(self.words_by_id)
+        categories = dict(self.categories_by_id)
+        if word_ids:
+            fresh = await db.words.find({"word_id": {"$in": list(word_ids)}}, {"_id": 0}).to_list(None)
+            for word_id in word_ids:
+                words.pop(word_id, None)
+            words.update((w["word_id"], w) for w in fresh)
+        if category_ids:
+            fresh = await db.categories.find({"category_id": {"$in": list(category_ids)}}, {"_id": 0}).to_list(None)
+            for category_id in category_ids:
+                categories.pop(category_id, None)
+            categories.update((c["category_id"], c) for c in fresh)
+            # Deleting a category deletes its words without listing them
+            words = {word_id: w for word_id, w in words.items()
+                     if w.get("category_id") in categories or w.get("category_id") not in category_ids}
+        self._swap(words, categories)
+        return True
+
+    def _swap(self, words: Dict[str, dict], categories: Dict[str, dict]):
+        by_category: Dict[str, List[str]] = {}
+        for word_id in sorted(words):
+            by_category.setdefault(words[word_id].get("category_id"), []).append(word_id)
+        self.words_by_id, self.categories_by_id, self.words_by_category = words, categories, by_category
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "words": len(self.words_by_id),
+            "categories": len(self.categories_by_id),
+            "memory_bytes": _deep_sizeof(
+                (self.words_by_id, self.categories_by_id, self.words_by_category), set()
+            ),
+            "full_reloads": self.full_reloads,
+            "incremental_reloads": self.incremental_reloads,
+            "last_reload_ms": self.last_reload_ms
+        }
+
+
+if os.environ.get("DICTIONARY_SNAPSHOT_PATH"):
+    # Several workers: share one memory-mapped copy instead of one dict each
+    from shared_dictionary import SharedDictionary
+    dictionary = SharedDictionary(os.environ["DICTIONARY_SNAPSHOT_PATH"])
+else:
+    dictionary = DictionarySnapshot()
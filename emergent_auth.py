@@ -0,0 +1,136 @@
+"""Pooled HTTP client for the Emergent OAuth session-data exchange"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+import aiohttp
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Point at fake_auth_server.py to exercise the OAuth login path offline
+AUTH_API_URL = os.environ.get(
+    "AUTH_API_URL", "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+AUTH_API_MAX_CONNECTIONS = int(os.environ.get("AUTH_API_MAX_CONNECTIONS", "20"))
+AUTH_API_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("AUTH_API_CONNECT_TIMEOUT_SECONDS", "2"))
+AUTH_API_TIMEOUT_SECONDS = float(os.environ.get("AUTH_API_TIMEOUT_SECONDS", "5"))
+AUTH_API_RETRIES = int(os.environ.get("AUTH_API_RETRIES", "2"))
+AUTH_API_BREAKER_THRESHOLD = int(os.environ.get("AUTH_API_BREAKER_THRESHOLD", "5"))
+AUTH_API_BREAKER_RESET_SECONDS = float(os.environ.get("AUTH_API_BREAKER_RESET_SECONDS", "30"))
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; lets one probe through after reset_seconds"""
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half_open":
+            # Re-arm so only this caller probes until the outcome is known
+            self.opened_at = time.monotonic()
+            return True
+        return state == "closed"
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+
+
+class EmergentAuthClient:
+    """App-lifetime aiohttp session with keep-alive, timeouts, bounded retry and a circuit breaker"""
+
+    def __init__(self, url: str = AUTH_API_URL):
+        self.url = url
+        self.breaker = CircuitBreaker(AUTH_API_BREAKER_THRESHOLD, AUTH_API_BREAKER_RESET_SECONDS)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected_by_breaker = 0
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=AUTH_API_MAX_CONNECTIONS,
+                    keepalive_timeout=30,
+                    ttl_dns_cache=300
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=AUTH_API_TIMEOUT_SECONDS,
+                    connect=AUTH_API_CONNECT_TIMEOUT_SECONDS
+                )
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_session_data(self, session_id: str) -> dict:
+        """Exchange an Emergent session_id for the user's profile and session token"""
+        if not self.breaker.allow():
+            self.rejected_by_breaker += 1
+            raise HTTPException(status_code=503, detail="Auth service unavailable")
+        await self.start()
+
+        headers = {"X-Session-ID": session_id}
+        for attempt in range(AUTH_API_RETRIES + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+            self.requests += 1
+            try:
+                async with self._session.get(self.url, headers=headers) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        self.breaker.record_success()
+                        return data
+                    if response.status < 500:
+                        # The service answered; the session id itself is bad
+                        self.breaker.record_success()
+                        raise HTTPException(status_code=401, detail="Invalid session ID")
+                    logger.warning(f"Auth API returned {response.status} (attempt {attempt + 1})")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Auth API request failed (attempt {attempt + 1}): {e!r}")
+
+        self.failures += 1
+        self.breaker.record_failure()
+        raise HTTPException(status_code=502, detail="Auth service unavailable")
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.times_opened,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected_by_breaker": self.rejected_by_breaker
+        }
+
+
+emergent_auth_client = EmergentAuthClient()
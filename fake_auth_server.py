@@ -0,0 +1,50 @@
+"""Local stand-in for the Emergent auth session-data API, for offline load tests
+
+    python fake_auth_server.py --port 8055 --latency-ms 30 --error-rate 0.01
+    AUTH_API_URL=http://127.0.0.1:8055/auth/v1/env/oauth/session-data uvicorn server:app
+
+Any X-Session-ID is accepted except ones starting with "invalid"; the same
+id always maps to the same user, so repeated logins exercise the update path.
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+from aiohttp import web
+
+SESSION_DATA_PATH = "/auth/v1/env/oauth/session-data"
+
+
+def make_app(latency_ms: float = 0, error_rate: float = 0) -> web.Application:
+    async def session_data(request: web.Request) -> web.Response:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if error_rate and random.random() < error_rate:
+            return web.json_response({"detail": "injected failure"}, status=503)
+
+        session_id = request.headers.get("X-Session-ID", "")
+        if not session_id or session_id.startswith("invalid"):
+            return web.json_response({"detail": "Invalid session"}, status=401)
+
+        digest = hashlib.sha256(session_id.encode()).hexdigest()
+        return web.json_response({
+            "id": digest[:16],
+            "email": f"{session_id}@loadtest.example.com",
+            "name": f"Load Test {session_id}",
+            "picture": None,
+            "session_token": f"fake_{digest[:32]}"
+        })
+
+    app = web.Application()
+    app.router.add_get(SESSION_DATA_PATH, session_data)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8055)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+    web.run_app(make_app(args.latency_ms, args.error_rate), host=args.host, port=args.port)
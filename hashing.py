@@ -0,0 +1,149 @@
+"""Bounded worker pool and cost calibration for bcrypt password hashing
+
+Run `python hashing.py --benchmark` to see bcrypt cost per round on this
+host and the logins per second one core can verify.
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from passlib.context import CryptContext
+from passlib.hash import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# bcrypt releases the GIL, so threads give real parallelism without blocking the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Calls allowed to wait for a worker before new ones are rejected
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "32"))
+
+# Cost selection: a fixed BCRYPT_ROUNDS wins, otherwise calibrate towards BCRYPT_TARGET_MS
+BCRYPT_ROUNDS = os.environ.get("BCRYPT_ROUNDS")
+BCRYPT_TARGET_MS = float(os.environ.get("BCRYPT_TARGET_MS", "250"))
+# passlib's default cost; calibration only ever raises it
+BCRYPT_MIN_ROUNDS = 12
+BCRYPT_MAX_ROUNDS = 15
+
+
+def measure_bcrypt_ms(rounds: int, samples: int = 3) -> float:
+    """Median wall time of one bcrypt hash at the given cost"""
+    hasher = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.hash("calibration-password")
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate_bcrypt_rounds(target_ms: float = BCRYPT_TARGET_MS,
+                            min_rounds: int = BCRYPT_MIN_ROUNDS,
+                            max_rounds: int = BCRYPT_MAX_ROUNDS) -> int:
+    """Highest cost whose hash time stays within target_ms (never below min_rounds)"""
+    # Each extra round doubles the work, so one measurement is enough to extrapolate
+    elapsed = measure_bcrypt_ms(min_rounds)
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed * 2 <= target_ms:
+        rounds += 1
+        elapsed *= 2
+    return rounds
+
+
+def apply_bcrypt_rounds(context: CryptContext, rounds: int):
+    """Hash new passwords at this cost and flag cheaper existing hashes for upgrade"""
+    context.update(bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+
+
+class PasswordHashPoolBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503"""
+
+
+class PasswordHasher:
+    """Runs CryptContext hash/verify on a dedicated thread pool with a queue cap"""
+
+    def __init__(self, context: CryptContext, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Only touched from the event loop thread, so no lock is needed
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rounds = None
+        self.rehashed = 0
+
+    async def _run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_pending:
+            self.rejected += 1
+            raise PasswordHashPoolBusy()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    def needs_update(self, hashed_password: str) -> bool:
+        return self.context.needs_update(hashed_password)
+
+    async def configure_cost(self, rounds: Optional[int] = None) -> int:
+        """Apply BCRYPT_ROUNDS, or calibrate on a worker thread when it is unset"""
+        if rounds is None and BCRYPT_ROUNDS:
+            rounds = int(BCRYPT_ROUNDS)
+        if rounds is None:
+            rounds = await asyncio.get_running_loop().run_in_executor(self._executor, calibrate_bcrypt_rounds)
+            logger.info(f"bcrypt cost calibrated to {rounds} rounds (target {BCRYPT_TARGET_MS:.0f} ms)")
+        elif rounds < BCRYPT_MIN_ROUNDS:
+            logger.warning(f"BCRYPT_ROUNDS={rounds} is below the recommended minimum of {BCRYPT_MIN_ROUNDS}")
+        apply_bcrypt_rounds(self.context, rounds)
+        self.rounds = rounds
+        return rounds
+
+    def stats(self) -> dict:
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.workers),
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _benchmark():
+    print(f"{'rounds':>6} {'ms/hash':>9} {'logins/s/core':>14}")
+    for rounds in range(BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS + 1):
+        elapsed = measure_bcrypt_ms(rounds)
+        print(f"{rounds:>6} {elapsed:>9.1f} {1000 / elapsed:>14.1f}")
+        if elapsed > BCRYPT_TARGET_MS * 4:
+            break
+    rounds = calibrate_bcrypt_rounds()
+    elapsed = measure_bcrypt_ms(rounds)
+    print(f"calibrated for {BCRYPT_TARGET_MS:.0f} ms target: {rounds} rounds, "
+          f"{1000 / elapsed:.1f} logins/s per core, "
+          f"{1000 / elapsed * PASSWORD_HASH_WORKERS:.1f} logins/s with {PASSWORD_HASH_WORKERS} workers")
+
+
+if __name__ == "__main__":
+    if "--benchmark" in sys.argv:
+        _benchmark()
@@ -0,0 +1,122 @@
+"""Declarative MongoDB index registry for YLM Sözlük
+
+Run `python indexes.py` to apply the registry, or `python indexes.py --check`
+to report missing and unused indexes without changing anything.
+"""
+import asyncio
+import logging
+import os
+import sys
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from database import MongoDatabase, get_mongo, close_mongo_connection
+
+logger = logging.getLogger(__name__)
+
+ENSURE_INDEXES_ON_STARTUP = os.environ.get("MONGO_ENSURE_INDEXES", "1") == "1"
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token"),
+        # Mongo's TTL monitor deletes sessions once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "user_progress": [
+        IndexModel([("user_id", ASCENDING), ("word_id", ASCENDING)], name="user_word_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("next_review", ASCENDING)], name="user_next_review"),
+        IndexModel([("user_id", ASCENDING), ("learned", ASCENDING)], name="user_learned"),
+    ],
+    "words": [
+        IndexModel([("word_id", ASCENDING)], name="word_id"),
+        # Serves category filters and keyset pagination over (category_id, word_id)
+        IndexModel([("category_id", ASCENDING), ("word_id", ASCENDING)], name="category_id_word_id"),
+        IndexModel([("created_by", ASCENDING)], name="created_by"),
+    ],
+    "token_versions": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "login_buckets": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "catalogue_changes": [
+        IndexModel([("version", ASCENDING)], name="version_unique", unique=True),
+        # Snapshots further behind than this fall back to a full reload
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=86400),
+    ],
+}
+
+
+def _key(spec) -> tuple:
+    """Normalise an index key spec so registry and server entries compare equal"""
+    return tuple((field, int(direction) if isinstance(direction, (int, float)) else direction)
+                 for field, direction in spec)
+
+
+async def ensure_indexes(db: MongoDatabase) -> dict:
+    """Create every registered index; safe to run on every startup"""
+    created = {}
+    for collection_name, models in INDEXES.items():
+        collection = db.collection(collection_name)
+        created[collection_name] = []
+        for model in models:
+            try:
+                created[collection_name] += await collection.create_indexes([model])
+            except OperationFailure as e:
+                # Existing index with other options, or duplicate keys blocking a unique index
+                logger.error(f"Index {collection_name}.{model.document['name']} not created: {e}")
+    return created
+
+
+async def check_indexes(db: MongoDatabase) -> dict:
+    """Report registered indexes that are missing and indexes with no accesses since mongod started"""
+    report = {}
+    for collection_name, models in INDEXES.items():
+        collection = db.collection(collection_name)
+        existing = await collection.index_information()
+        existing_keys = {_key(info["key"]): name for name, info in existing.items()}
+
+        missing = [
+            model.document["name"] for model in models
+            if _key(model.document["key"].items()) not in existing_keys
+        ]
+
+        unused = []
+        try:
+            async for stat in collection.aggregate([{"$indexStats": {}}]):
+                if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0:
+                    unused.append(stat["name"])
+        except OperationFailure as e:
+            logger.warning(f"$indexStats unavailable for {collection_name}: {e}")
+
+        report[collection_name] = {
+            "missing": missing,
+            "unused": sorted(unused),
+            "existing": sorted(existing_keys.values())
+        }
+    return report
+
+
+async def _main(check_only: bool):
+    db = get_mongo()
+    try:
+        if check_only:
+            report = await check_indexes(db)
+            for collection_name, result in report.items():
+                print(f"{collection_name}: missing={result['missing']} unused={result['unused']}")
+            return 1 if any(r["missing"] for r in report.values()) else 0
+        created = await ensure_indexes(db)
+        for collection_name, names in created.items():
+            print(f"{collection_name}: {', '.join(names)}")
+        return 0
+    finally:
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main("--check" in sys.argv)))
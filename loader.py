@@ -0,0 +1,144 @@
+"""DataLoader-style batching for per-row lookups
+
+`await loader.load(key)` calls made in the same event-loop tick are coalesced
+into one batch function call, which issues a single `$in` query (or none, when
+the dictionary snapshot already has every key). Results are cached for the
+rest of the request; endpoints get their loaders through `Depends(get_loaders)`.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List
+from fastapi import Depends, Request
+from database import MongoDatabase, get_db
+from dictionary import dictionary
+
+MAX_BATCH_SIZE = 1000
+
+# Process-wide totals for /api/admin/metrics
+_totals = {"requests": 0, "loads": 0, "batches": 0, "round_trips": 0, "snapshot_hits": 0}
+
+
+class BatchLoader:
+    """Coalesces load(key) calls into batch_fn(keys) -> {key: value}; missing keys load as None"""
+
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+                 max_batch_size: int = MAX_BATCH_SIZE):
+        self._batch_fn = batch_fn
+        self._max_batch_size = max_batch_size
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+        self.loads = 0
+        self.batches = 0
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        self.loads += 1
+        _totals["loads"] += 1
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._cache[key] = future
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                # Dispatch once everything scheduled in this tick has queued its key
+                loop.call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> list:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Hashable, value: Any):
+        """Seed the cache with a value the caller already has"""
+        if key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._cache[key] = future
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        for i in range(0, len(keys), self._max_batch_size):
+            asyncio.ensure_future(self._run(keys[i:i + self._max_batch_size]))
+
+    async def _run(self, keys: List[Hashable]):
+        self.batches += 1
+        _totals["batches"] += 1
+        try:
+            results = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                # Failed keys are retried by the next load
+                future = self._cache.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key in keys:
+            future = self._cache[key]
+            if not future.done():
+                future.set_result(results.get(key))
+
+
+class RequestLoaders:
+    """The loaders of one request, sharing its database handle and round-trip count"""
+
+    def __init__(self, db: MongoDatabase):
+        self.db = db
+        self.round_trips = 0
+        self.words = BatchLoader(self._load_words)
+        self.categories = BatchLoader(self._load_categories)
+        self.student_progress = BatchLoader(self._load_student_progress)
+        _totals["requests"] += 1
+
+    def _round_trip(self):
+        self.round_trips += 1
+        _totals["round_trips"] += 1
+
+    async def _from_snapshot(self, keys: list, lookup: str, collection, field: str) -> dict:
+        snapshot = await dictionary.current(self.db)
+        found = {}
+        for key in keys:
+            doc = getattr(snapshot, lookup)(key)
+            if doc is not None:
+                found[key] = doc
+        _totals["snapshot_hits"] += len(found)
+        # Written by another worker after our last version poll, or deleted
+        missing = [key for key in keys if key not in found]
+        if missing:
+            self._round_trip()
+            async for doc in collection.find({field: {"$in": missing}}, {"_id": 0}):
+                found[doc[field]] = doc
+        return found
+
+    async def _load_words(self, word_ids: list) -> dict:
+        return await self._from_snapshot(word_ids, "word", self.db.words, "word_id")
+
+    async def _load_categories(self, category_ids: list) -> dict:
+        return await self._from_snapshot(category_ids, "category", self.db.categories, "category_id")
+
+    async def _load_student_progress(self, user_ids: list) -> dict:
+        """{user_id: {"total": studied words, "mastered": words with mastery >= 80}}"""
+        self._round_trip()
+        rows = await self.db.user_progress.aggregate([
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$group": {
+                "_id": "$user_id",
+                "total": {"$sum": 1},
+                "mastered": {"$sum": {"$cond": [{"$gte": ["$mastery", 80]}, 1, 0]}}
+            }}
+        ]).to_list(None)
+        counts = {user_id: {"total": 0, "mastered": 0} for user_id in user_ids}
+        counts.update((row["_id"], {"total": row["total"], "mastered": row["mastered"]}) for row in rows)
+        return counts
+
+
+async def get_loaders(request: Request, db = Depends(get_db)) -> RequestLoaders:
+    """Per-request loaders, memoized on request.state"""
+    loaders = getattr(request.state, "loaders", None)
+    if loaders is None:
+        loaders = RequestLoaders(db)
+        request.state.loaders = loaders
+    return loaders
+
+
+def loader_stats() -> dict:
+    stats = dict(_totals)
+    stats["round_trips_per_request"] = round(stats["round_trips"] / stats["requests"], 3) if stats["requests"] else 0.0
+    return stats
@@ -11,7 +11,6 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient
 
 # --- MODÜLLER ---
 from models import (
@@ -22,11 +21,20 @@ from auth import (
     get_session_data, create_or_update_user, create_session,
     get_current_user, require_auth, require_teacher, require_super_admin,
     authenticate_user, create_access_token, get_password_hash, 
-    get_current_user_from_token
+    get_current_user_from_token, password_hasher, create_user_token
 )
 from teacher_management import teacher_router
 from progress import router as progress_router
 from user_content import router as user_content_router
+from database import get_db, connect_to_mongo, close_mongo_connection
+from indexes import ensure_indexes, ENSURE_INDEXES_ON_STARTUP
+from token_versions import token_versions
+from emergent_auth import emergent_auth_client
+from rate_limit import admit_login
+from pagination import keyset_page, clamp_page_size, WORD_KEYSET
+from catalogue import catalogue, categories_response
+from dictionary import dictionary
+from words_learned import words_learned_reconciler
 
 # --- AYARLAR ---
 ROOT_DIR = Path(__file__).parent
@@ -40,12 +48,23 @@ DB_NAME = "test_database"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     if MONGO_URL:
-        app.mongodb_client = AsyncIOMotorClient(MONGO_URL)
-        app.mongodb = app.mongodb_client[DB_NAME]
+        app.state.mongo = connect_to_mongo(MONGO_URL, DB_NAME)
+        if ENSURE_INDEXES_ON_STARTUP:
+            await ensure_indexes(app.state.mongo)
+        await token_versions.start(app.state.mongo)
+        await catalogue.start(app.state.mongo)
+        await dictionary.current(app.state.mongo)
+        await words_learned_reconciler.start(app.state.mongo)
         logging.info(f"Veritabanına Bağlanıldı: {DB_NAME}")
+    await password_hasher.configure_cost()
+    await emergent_auth_client.start()
     yield
+    await emergent_auth_client.close()
     if MONGO_URL:
-        app.mongodb_client.close()
+        await token_versions.stop()
+        await catalogue.stop()
+        await words_learned_reconciler.stop()
+        close_mongo_connection()
 
 app = FastAPI(title="YLM Sozluk API", lifespan=lifespan)
 
@@ -68,23 +87,26 @@ app.add_middleware(
 )
 
 logging.basicConfig(level=logging.INFO)
-async def get_db(): return app.mongodb
 api_router = APIRouter(prefix="/api")
 
 # ==================== GİRİŞ VE TAMİR ====================
 
 @api_router.post("/login")
-async def login(body: dict, db = Depends(get_db)):
+async def login(request: Request, body: dict, db = Depends(get_db)):
     email = body.get("email")
     password = body.get("password")
     
+    # 0. Şifre kontrolünden önce deneme limitini uygula
+    if email:
+        await admit_login(db, email, request.client.host if request.client else None)
+    
     # 1. Kullanıcıyı doğrula
     user = await authenticate_user(email, password)
     if not user:
         raise HTTPException(status_code=401, detail="Hatalı şifre")
     
     # 2. Token oluştur
-    access_token = create_access_token(data={"sub": email})
+    access_token = create_user_token(user.user_id, user.email, user.role, user.subscription)
 
     # --- HATA DÜZELTME BÖLÜMÜ ---
     try:
@@ -120,7 +142,7 @@ async def register(body: dict, db = Depends(get_db)):
         "user_id": f"user_{uuid.uuid4().hex[:12]}",
         "email": email,
         "name": body.get("name", "Kullanıcı"),
-        "hashed_password": get_password_hash(password),
+        "hashed_password": await get_password_hash(password),
         "role": role,
         "subscription": sub,
         "created_at": datetime.now(timezone.utc),
@@ -131,7 +153,8 @@ async def register(body: dict, db = Depends(get_db)):
     response_user = user_data.copy()
     del response_user["hashed_password"]
     
-    return {"token": create_access_token(data={"sub": email}), "user": response_user}
+    token = create_user_token(user_data["user_id"], email, role, sub)
+    return {"token": token, "user": response_user}
 
 @api_router.get("/me")
 async def get_me(user: User = Depends(get_current_user_from_token)):
@@ -140,8 +163,8 @@ async def get_me(user: User = Depends(get_current_user_from_token)):
 # ==================== KELİME & KATEGORİ ====================
 
 @api_router.get("/categories")
-async def get_categories(db = Depends(get_db)):
-    return await db.categories.find({}, {"_id": 0}).to_list(100)
+async def get_categories(request: Request, db = Depends(get_db)):
+    return await categories_response(request, db)
 
 @api_router.post("/categories")
 async def create_category(body: dict, db = Depends(get_db), user = Depends(require_auth)):
@@ -153,13 +176,15 @@ async def create_category(body: dict, db = Depends(get_db), user = Depends(requi
         "created_at": datetime.now(timezone.utc)
     }
     await db.categories.insert_one(new_cat)
+    await catalogue.bump(db, category_ids=[new_cat["category_id"]])
     return new_cat
 
-@api_router.get("/words", response_model=List[Word])
-async def get_words(category_id: Optional[str] = None, limit: int=100, skip: int=0, db=Depends(get_db), user=Depends(require_auth)):
+@api_router.get("/words")
+async def get_words(category_id: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None, db=Depends(get_db), user=Depends(require_auth)):
     query = {}
     if category_id: query["category_id"] = category_id
-    return await db.words.find(query, {"_id":0}).skip(skip).limit(limit).to_list(limit)
+    page = await keyset_page(db.words, query, WORD_KEYSET, clamp_page_size(limit), cursor, {"_id": 0})
+    return {"words": page["items"], "next_cursor": page["next_cursor"], "has_more": page["has_more"]}
 
 @api_router.post("/words")
 async def create_word(word: WordCreate, db=Depends(get_db), user=Depends(require_auth)):
@@ -171,6 +196,7 @@ async def create_word(word: WordCreate, db=Depends(get_db), user=Depends(require
     }
     await db.words.insert_one(word_data)
     await db.categories.update_one({"category_id": word.category_id}, {"$inc": {"word_count": 1}})
+    await catalogue.bump(db, word_ids=[word_data["word_id"]], category_ids=[word.category_id])
     return Word(**word_data)
 
 @api_router.post("/words/ai-example")
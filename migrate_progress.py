@@ -0,0 +1,153 @@
+"""Migrate user_progress to the single scheduler schema (schema_version 2)
+
+Cards written by the old level/learned and mastery/interval_days code are
+converted with the same defaults scheduler.card_state() applies on review,
+so a migrated card schedules exactly as it would have unmigrated. Stored
+learned, mastery and level values are kept, so a card stays learned by the
+threshold of the code that wrote it and users.words_learned is unaffected;
+only missing ones are derived.
+
+Safe to run against production:
+- every update is compare-and-set on the review_count and last_reviewed
+  values it read, so a card reviewed in the meantime (which the review
+  pipeline converts itself) is skipped rather than overwritten
+- writes are throttled to --ops-per-second (MIGRATION_OPS_PER_SECOND)
+- the last migrated _id is checkpointed in the `migrations` collection
+  after each batch, so an interrupted run resumes where it stopped; a run
+  after a completed one starts over
+
+Run with `python migrate_progress.py [--batch-size N] [--ops-per-second N] [--restart]`.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from pymongo import UpdateOne
+from database import MongoDatabase, get_mongo, close_mongo_connection
+from review import was_learned
+from scheduler import SCHEMA_VERSION, STATE_FIELDS, card_state, derive
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = f"user_progress_schema_v{SCHEMA_VERSION}"
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", "500"))
+# 0 disables the throttle
+MIGRATION_OPS_PER_SECOND = float(os.environ.get("MIGRATION_OPS_PER_SECOND", "1000"))
+
+PENDING_QUERY = {"schema_version": {"$ne": SCHEMA_VERSION}}
+
+
+def migrated_fields(card: dict, now: datetime) -> dict:
+    """$set fields converting one stored card to schema_version 2"""
+    state = card_state(card)
+    mastery, level, _ = derive(np.array([state["interval_days"]]))
+    correct = card.get("correct_count") or 0
+    incorrect = card.get("incorrect_count") or 0
+    fields = {field: state[field] for field in STATE_FIELDS}
+    fields.update({
+        "repetitions": int(state["repetitions"]),
+        "correct_count": correct,
+        "incorrect_count": incorrect,
+        "review_count": card.get("review_count") or correct + incorrect,
+        "mastery": card["mastery"] if card.get("mastery") is not None else float(mastery[0]),
+        "level": card["level"] if card.get("level") is not None else int(level[0]),
+        # Never moves the card across the learned threshold
+        "learned": was_learned(card),
+        "schema_version": SCHEMA_VERSION,
+        "migrated_at": now
+    })
+    if card.get("next_review") is None:
+        last_reviewed = card.get("last_reviewed")
+        fields["next_review"] = last_reviewed + timedelta(days=state["interval_days"]) if last_reviewed else now
+    return fields
+
+
+async def migrate_progress(db: MongoDatabase, batch_size: int = MIGRATION_BATCH_SIZE,
+                           ops_per_second: float = MIGRATION_OPS_PER_SECOND, restart: bool = False) -> dict:
+    """Convert every pending card in _id order, resuming from the stored checkpoint"""
+    checkpoint = None if restart else await db.migrations.find_one({"_id": MIGRATION_ID})
+    if checkpoint is None or checkpoint.get("completed_at"):
+        # A finished run starts over, picking up cards skipped or written by old code since
+        await db.migrations.delete_one({"_id": MIGRATION_ID})
+        checkpoint = {}
+    last_id = checkpoint.get("last_id")
+    migrated = checkpoint.get("migrated", 0)
+    skipped = checkpoint.get("skipped", 0)
+
+    query = dict(PENDING_QUERY)
+    if last_id is not None:
+        query["_id"] = {"$gt": last_id}
+    remaining = await db.user_progress.count_documents(query)
+    logger.info(f"{MIGRATION_ID}: {remaining} cards to migrate"
+                + (f", resuming after _id {last_id}" if last_id is not None else ""))
+
+    started = time.monotonic()
+    done = 0
+    while True:
+        batch_started = time.monotonic()
+        cards = await db.user_progress.find(query).sort("_id", 1).to_list(batch_size)
+        if not cards:
+            break
+        now = datetime.now(timezone.utc)
+        ops = []
+        for card in cards:
+            # Compare-and-set: a review since we read the card has already converted it
+            ops.append(UpdateOne(
+                {"_id": card["_id"], "review_count": card.get("review_count"),
+                 "last_reviewed": card.get("last_reviewed"), **PENDING_QUERY},
+                {"$set": migrated_fields(card, now)}
+            ))
+        result = await db.user_progress.bulk_write(ops, ordered=False)
+        migrated += result.modified_count
+        skipped += len(ops) - result.modified_count
+        done += len(ops)
+
+        last_id = cards[-1]["_id"]
+        query["_id"] = {"$gt": last_id}
+        await db.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": last_id, "migrated": migrated, "skipped": skipped, "updated_at": now},
+             "$setOnInsert": {"started_at": now}},
+            upsert=True
+        )
+        elapsed = time.monotonic() - started
+        logger.info(f"{MIGRATION_ID}: {done}/{remaining} ({migrated} migrated, {skipped} skipped, "
+                    f"{done / elapsed if elapsed else 0:.0f} ops/s)")
+
+        if ops_per_second > 0:
+            await asyncio.sleep(max(0.0, len(ops) / ops_per_second - (time.monotonic() - batch_started)))
+
+    await db.migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed_at": datetime.now(timezone.utc), "migrated": migrated, "skipped": skipped}},
+        upsert=True
+    )
+    return {"migrated": migrated, "skipped": skipped}
+
+
+async def _main(args: argparse.Namespace) -> int:
+    db = get_mongo()
+    try:
+        report = await migrate_progress(db, args.batch_size, args.ops_per_second, args.restart)
+        print(report)
+        # Skipped cards were reviewed mid-run; only old-schema writers leave them pending
+        pending = await db.user_progress.count_documents(PENDING_QUERY)
+        if pending:
+            print(f"{pending} cards still pending; run again to pick them up")
+        return 0
+    finally:
+        close_mongo_connection()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--ops-per-second", type=float, default=MIGRATION_OPS_PER_SECOND,
+                        help="0 disables the throttle")
+    parser.add_argument("--restart", action="store_true", help="ignore the stored checkpoint")
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(parser.parse_args())))
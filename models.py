@@ -110,6 +110,14 @@ class ProgressUpdate(BaseModel):
     word_id: str
     correct: bool
 
+class ReviewResult(BaseModel):
+    word_id: str
+    correct: bool
+    reviewed_at: Optional[datetime] = None  # When the card was answered; lets offline sessions sync later
+
+class BatchReviewRequest(BaseModel):
+    reviews: List[ReviewResult] = Field(..., min_length=1, max_length=500)
+
 class ProgressStats(BaseModel):
     total_words: int
     words_learned: int
@@ -0,0 +1,65 @@
+"""Keyset (cursor) pagination helpers"""
+import base64
+import json
+import os
+from typing import Optional
+from fastapi import HTTPException
+from pymongo import ASCENDING
+
+WORDS_PAGE_SIZE = int(os.environ.get("WORDS_PAGE_SIZE", "100"))
+WORDS_MAX_PAGE_SIZE = int(os.environ.get("WORDS_MAX_PAGE_SIZE", "500"))
+
+# Sort order for word listings; backed by the words (category_id, word_id) index
+WORD_KEYSET = ["category_id", "word_id"]
+
+
+def encode_cursor(values: list) -> str:
+    """Opaque cursor holding the sort key of the last item returned"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if limit is None:
+        return WORDS_PAGE_SIZE
+    return max(1, min(limit, WORDS_MAX_PAGE_SIZE))
+
+
+def keyset_filter(fields: list, values: list) -> dict:
+    """Documents strictly after `values` in the ascending order of `fields`"""
+    branches = []
+    for i, field in enumerate(fields):
+        branch = {fields[j]: values[j] for j in range(i)}
+        branch[field] = {"$gt": values[i]}
+        branches.append(branch)
+    return {"$or": branches}
+
+
+def keyset_cursor(collection, query: dict, fields: list, cursor: Optional[str] = None,
+                  projection: Optional[dict] = None):
+    """Motor cursor over `query` in keyset order, starting after `cursor`"""
+    if cursor:
+        query = {"$and": [query, keyset_filter(fields, decode_cursor(cursor, len(fields)))]}
+    return collection.find(query, projection).sort([(field, ASCENDING) for field in fields])
+
+
+async def keyset_page(collection, query: dict, fields: list, limit: int,
+                      cursor: Optional[str] = None, projection: Optional[dict] = None) -> dict:
+    """One page of at most `limit` documents plus the cursor for the next one"""
+    # One extra document tells us whether another page exists
+    items = await keyset_cursor(collection, query, fields, cursor, projection).limit(limit + 1).to_list(limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    next_cursor = encode_cursor([items[-1].get(field) for field in fields]) if has_more else None
+    return {"items": items, "next_cursor": next_cursor, "has_more": has_more}
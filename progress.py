@@ -1,198 +1,246 @@
 """Progress tracking endpoints for YLM Sözlük"""
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from typing import List
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
-from models import UserProgress, ProgressUpdate, ProgressStats
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from models import UserProgress, ProgressUpdate, ProgressStats, BatchReviewRequest
 from auth import require_auth
-import os
+from database import get_db
+from loader import get_loaders
+from review import LEVEL_INTERVAL_DAYS, MAX_LEVEL, learned_delta, was_learned
+from scheduler import new_card, scheduler
+from words_learned import adjust_words_learned
 
 router = APIRouter(prefix="/progress", tags=["progress"])
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Rounds of re-reading cards that changed between our read and our write
+BATCH_REVIEW_ATTEMPTS = 3
 
 
 def calculate_next_review(level: int) -> datetime:
     """Calculate next review date based on spaced repetition"""
-    intervals = {
-        0: 0,      # Immediate review
-        1: 1,      # 1 day
-        2: 3,      # 3 days
-        3: 7,      # 7 days
-        4: 15,     # 15 days
-        5: 30      # 30 days (mastered)
-    }
-    days = intervals.get(level, 0)
+    days = LEVEL_INTERVAL_DAYS[level] if 0 <= level <= MAX_LEVEL else 0
     return datetime.now(timezone.utc) + timedelta(days=days)
 
 
 @router.post("/update")
-async def update_progress(request: Request, progress_data: ProgressUpdate):
+async def update_progress(request: Request, progress_data: ProgressUpdate, db = Depends(get_db),
+                          loaders = Depends(get_loaders)):
     """Update user progress after quiz/flashcard"""
     user = await require_auth(request)
     
     # Get the word to find category_id
-    word = await db.words.find_one({"word_id": progress_data.word_id}, {"_id": 0})
+    word = await loaders.words.load(progress_data.word_id)
     if not word:
         raise HTTPException(status_code=404, detail="Word not found")
     
-    # Find existing progress
-    existing = await db.user_progress.find_one({
-        "user_id": user.user_id,
-        "word_id": progress_data.word_id
-    }, {"_id": 0})
+    # Read, update or create the card in one atomic round trip
+    before, progress = await scheduler.review(
+        db.user_progress, user.user_id, progress_data.word_id, word.get("category_id", ""),
+        progress_data.correct, datetime.now(timezone.utc)
+    )
     
+    # Update user's overall stats only when the card crossed the learned threshold
+    total_learned = await adjust_words_learned(db, user, learned_delta(before, progress))
+    
+    response = {
+        "success": True,
+        "progress": progress,
+        "message": "İlerleme kaydedildi" if progress_data.correct else "Tekrar dene!"
+    }
+    if total_learned is not None:
+        # Only known without an extra read when the counter was just written
+        response["words_learned"] = total_learned
+    return response
+
+
+@router.post("/batch")
+async def submit_review_batch(request: Request, batch: BatchReviewRequest, db = Depends(get_db),
+                              loaders = Depends(get_loaders)):
+    """Apply a whole flashcard session (possibly recorded offline) at once"""
+    user = await require_auth(request)
     now = datetime.now(timezone.utc)
     
-    if existing:
-        # Update existing progress
-        new_level = existing.get("level", 0)
-        correct_count = existing.get("correct_count", 0)
-        incorrect_count = existing.get("incorrect_count", 0)
-        
-        if progress_data.correct:
-            correct_count += 1
-            new_level = min(new_level + 1, 5)  # Max level 5
-        else:
-            incorrect_count += 1
-            new_level = max(new_level - 1, 0)  # Min level 0
-        
-        learned = new_level >= 5
-        next_review = calculate_next_review(new_level)
-        
-        await db.user_progress.update_one(
-            {"user_id": user.user_id, "word_id": progress_data.word_id},
-            {"$set": {
-                "correct_count": correct_count,
-                "incorrect_count": incorrect_count,
-                "level": new_level,
-                "learned": learned,
-                "last_reviewed": now,
-                "next_review": next_review,
-                "updated_at": now
-            }}
-        )
-    else:
-        # Create new progress entry
-        new_level = 1 if progress_data.correct else 0
-        progress_entry = {
-            "progress_id": f"prog_{user.user_id[:8]}_{progress_data.word_id[:8]}",
-            "user_id": user.user_id,
-            "word_id": progress_data.word_id,
-            "category_id": word.get("category_id", ""),
-            "learned": False,
-            "correct_count": 1 if progress_data.correct else 0,
-            "incorrect_count": 0 if progress_data.correct else 1,
-            "level": new_level,
-            "last_reviewed": now,
-            "next_review": calculate_next_review(new_level),
-            "created_at": now,
-            "updated_at": now
-        }
-        await db.user_progress.insert_one(progress_entry)
-    
-    # Update user's overall stats
-    total_learned = await db.user_progress.count_documents({
-        "user_id": user.user_id,
-        "learned": True
-    })
+    word_ids = list(dict.fromkeys(r.word_id for r in batch.reviews))
+    words = dict(zip(word_ids, await loaders.words.load_many(word_ids)))
+    known_ids = [w for w in word_ids if words[w]]
     
-    await db.users.update_one(
-        {"user_id": user.user_id},
-        {"$set": {"words_learned": total_learned}}
-    )
+    pending = set(known_ids)
+    item_states = {}
+    learned_delta_total = 0
+    for _ in range(BATCH_REVIEW_ATTEMPTS):
+        if not pending:
+            break
+        stored = {p["word_id"]: p async for p in db.user_progress.find(
+            {"user_id": user.user_id, "word_id": {"$in": list(pending)}}, {"_id": 0}
+        )}
+        # The k-th review of every card goes into round k, and each round is one
+        # vectorized scheduler call; each card is then written once
+        rounds = []
+        seen = {}
+        for i, review in enumerate(batch.reviews):
+            if review.word_id in pending:
+                k = seen[review.word_id] = seen.get(review.word_id, -1) + 1
+                if k == len(rounds):
+                    rounds.append([])
+                rounds[k].append(i)
+        new_state = {}
+        learned_before = {}
+        states = {}
+        for indexes in rounds:
+            cards, correct, reviewed_at = [], [], []
+            for i in indexes:
+                review = batch.reviews[i]
+                card = new_state.get(review.word_id) or stored.get(review.word_id) or new_card(
+                    user.user_id, review.word_id, words[review.word_id].get("category_id", ""))
+                at = review.reviewed_at or now
+                if at.tzinfo is None:
+                    at = at.replace(tzinfo=timezone.utc)
+                cards.append(card)
+                correct.append(review.correct)
+                reviewed_at.append(min(at, now))
+            for i, card, state in zip(indexes, cards, scheduler.review_cards(cards, correct, reviewed_at)):
+                learned_before.setdefault(state["word_id"], was_learned(card))
+                new_state[state["word_id"]] = states[i] = state
+        word_order = list(new_state)
+        operations = []
+        for word_id in word_order:
+            state = new_state[word_id]
+            # Only write over the version we read; a concurrent review makes this op fail
+            operations.append(UpdateOne(
+                {"user_id": user.user_id, "word_id": word_id,
+                 "review_count": stored.get(word_id, {}).get("review_count")},
+                {"$set": {k: v for k, v in state.items() if k not in ("user_id", "word_id")}},
+                upsert=True
+            ))
+        conflicts = set()
+        try:
+            await db.user_progress.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            conflicts = {word_order[error["index"]] for error in e.details.get("writeErrors", [])}
+        for word_id in word_order:
+            if word_id not in conflicts:
+                learned_delta_total += int(new_state[word_id]["learned"]) - int(learned_before[word_id])
+                pending.discard(word_id)
+        item_states.update((i, state) for i, state in states.items() if state["word_id"] not in conflicts)
     
-    return {
-        "success": True,
-        "words_learned": total_learned,
-        "message": "İlerleme kaydedildi" if progress_data.correct else "Tekrar dene!"
+    total_learned = await adjust_words_learned(db, user, learned_delta_total)
+    
+    results = []
+    for i, review in enumerate(batch.reviews):
+        state = item_states.get(i)
+        if not words.get(review.word_id):
+            results.append({"word_id": review.word_id, "status": "not_found"})
+        elif state is None:
+            results.append({"word_id": review.word_id, "status": "conflict"})
+        else:
+            results.append({
+                "word_id": review.word_id,
+                "status": "applied",
+                "level": state["level"],
+                "learned": state["learned"],
+                "next_review": state["next_review"].isoformat()
+            })
+    response = {
+        "applied": sum(1 for r in results if r["status"] == "applied"),
+        "results": results
     }
+    if total_learned is not None:
+        response["words_learned"] = total_learned
+    return response
 
 
 @router.get("/stats")
-async def get_progress_stats(request: Request):
+async def get_progress_stats(request: Request, db = Depends(get_db)):
     """Get user's progress statistics"""
     user = await require_auth(request)
     
-    # Get all progress entries
-    all_progress = await db.user_progress.find(
-        {"user_id": user.user_id},
-        {"_id": 0}
-    ).to_list(10000)
-    
-    # Calculate stats
-    total_words = len(all_progress)
-    words_learned = len([p for p in all_progress if p.get("learned", False)])
-    words_in_progress = total_words - words_learned
-    
-    # Calculate accuracy
-    total_correct = sum(p.get("correct_count", 0) for p in all_progress)
-    total_incorrect = sum(p.get("incorrect_count", 0) for p in all_progress)
-    total_attempts = total_correct + total_incorrect
-    accuracy = (total_correct / total_attempts * 100) if total_attempts > 0 else 0
-    
-    # Get category progress
-    categories_dict = {}
-    for p in all_progress:
-        cat_id = p.get("category_id", "unknown")
-        if cat_id not in categories_dict:
-            categories_dict[cat_id] = {
-                "total": 0,
-                "learned": 0
-            }
-        categories_dict[cat_id]["total"] += 1
-        if p.get("learned", False):
-            categories_dict[cat_id]["learned"] += 1
-    
-    # Fetch category names
-    categories_progress = []
-    for cat_id, stats in categories_dict.items():
-        cat = await db.categories.find_one({"category_id": cat_id}, {"_id": 0, "name_tr": 1, "name_ru": 1})
-        if cat:
-            categories_progress.append({
-                "category_id": cat_id,
-                "name_tr": cat.get("name_tr", ""),
-                "name_ru": cat.get("name_ru", ""),
-                "total": stats["total"],
-                "learned": stats["learned"],
-                "progress": (stats["learned"] / stats["total"] * 100) if stats["total"] > 0 else 0
-            })
+    # Totals, per-category progress and recent activity in one aggregation
+    learned = {"$cond": [{"$eq": ["$learned", True]}, 1, 0]}
+    result = await db.user_progress.aggregate([
+        {"$match": {"user_id": user.user_id}},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_words": {"$sum": 1},
+                    "words_learned": {"$sum": learned},
+                    "correct": {"$sum": {"$ifNull": ["$correct_count", 0]}},
+                    "incorrect": {"$sum": {"$ifNull": ["$incorrect_count", 0]}}
+                }}
+            ],
+            "categories": [
+                {"$group": {
+                    "_id": {"$ifNull": ["$category_id", "unknown"]},
+                    "total": {"$sum": 1},
+                    "learned": {"$sum": learned}
+                }},
+                {"$lookup": {
+                    "from": "categories",
+                    "localField": "_id",
+                    "foreignField": "category_id",
+                    "as": "category"
+                }},
+                {"$unwind": "$category"},
+                {"$sort": {"_id": 1}},
+                {"$project": {
+                    "_id": 0,
+                    "category_id": "$_id",
+                    "name_tr": {"$ifNull": ["$category.name_tr", ""]},
+                    "name_ru": {"$ifNull": ["$category.name_ru", ""]},
+                    "total": 1,
+                    "learned": 1,
+                    "progress": {"$multiply": [{"$divide": ["$learned", "$total"]}, 100]}
+                }}
+            ],
+            # $sort + $limit keeps only the top 10 in memory
+            "recent": [
+                {"$match": {"last_reviewed": {"$ne": None}}},
+                {"$sort": {"last_reviewed": -1}},
+                {"$limit": 10},
+                {"$lookup": {
+                    "from": "words",
+                    "localField": "word_id",
+                    "foreignField": "word_id",
+                    "as": "word"
+                }},
+                {"$unwind": "$word"},
+                {"$project": {
+                    "_id": 0,
+                    "word_id": 1,
+                    "turkish": {"$ifNull": ["$word.turkish", ""]},
+                    "russian": {"$ifNull": ["$word.russian", ""]},
+                    "level": {"$ifNull": ["$level", 0]},
+                    "last_reviewed": 1
+                }}
+            ]
+        }}
+    ]).to_list(1)
+    facets = result[0] if result else {"totals": [], "categories": [], "recent": []}
+    totals = facets["totals"][0] if facets["totals"] else {}
+    
+    total_words = totals.get("total_words", 0)
+    words_learned = totals.get("words_learned", 0)
+    total_attempts = totals.get("correct", 0) + totals.get("incorrect", 0)
+    accuracy = (totals.get("correct", 0) / total_attempts * 100) if total_attempts > 0 else 0
     
-    # Get recent activity (last 10 reviews)
-    recent = sorted(all_progress, key=lambda x: x.get("last_reviewed", datetime.min), reverse=True)[:10]
-    recent_activity = []
-    for r in recent:
-        if r.get("last_reviewed"):
-            word = await db.words.find_one({"word_id": r["word_id"]}, {"_id": 0, "turkish": 1, "russian": 1})
-            if word:
-                recent_activity.append({
-                    "word_id": r["word_id"],
-                    "turkish": word.get("turkish", ""),
-                    "russian": word.get("russian", ""),
-                    "level": r.get("level", 0),
-                    "last_reviewed": r["last_reviewed"].isoformat()
-                })
-    
-    # Calculate streak (simplified - days with any activity)
-    user_data = await db.users.find_one({"user_id": user.user_id}, {"_id": 0})
-    streak = user_data.get("streak", 0) if user_data else 0
+    for r in facets["recent"]:
+        r["last_reviewed"] = r["last_reviewed"].isoformat()
     
     return {
         "total_words": total_words,
         "words_learned": words_learned,
-        "words_in_progress": words_in_progress,
+        "words_in_progress": total_words - words_learned,
         "accuracy": round(accuracy, 1),
-        "streak": streak,
-        "categories_progress": categories_progress,
-        "recent_activity": recent_activity
+        "streak": user.streak,
+        "categories_progress": facets["categories"],
+        "recent_activity": facets["recent"]
     }
 
 
 @router.get("/words-to-review")
-async def get_words_to_review(request: Request):
+async def get_words_to_review(request: Request, db = Depends(get_db), loaders = Depends(get_loaders)):
     """Get words that need to be reviewed (spaced repetition)"""
     user = await require_auth(request)
     
@@ -206,9 +254,9 @@ async def get_words_to_review(request: Request):
     }, {"_id": 0}).to_list(1000)
     
     # Get word details
+    words = await loaders.words.load_many(p["word_id"] for p in progress_entries)
     words_to_review = []
-    for progress in progress_entries:
-        word = await db.words.find_one({"word_id": progress["word_id"]}, {"_id": 0})
+    for progress, word in zip(progress_entries, words):
         if word:
             words_to_review.append({
                 **word,
@@ -223,7 +271,7 @@ async def get_words_to_review(request: Request):
 
 
 @router.get("/learned-words")
-async def get_learned_words(request: Request):
+async def get_learned_words(request: Request, db = Depends(get_db), loaders = Depends(get_loaders)):
     """Get all learned words"""
     user = await require_auth(request)
     
@@ -234,9 +282,9 @@ async def get_learned_words(request: Request):
     }, {"_id": 0}).to_list(10000)
     
     # Get word details
+    words = await loaders.words.load_many(p["word_id"] for p in progress_entries)
     learned_words = []
-    for progress in progress_entries:
-        word = await db.words.find_one({"word_id": progress["word_id"]}, {"_id": 0})
+    for progress, word in zip(progress_entries, words):
         if word:
             learned_words.append({
                 **word,
@@ -0,0 +1,128 @@
+"""Token-bucket admission control for password logins
+
+Buckets live in an in-process LRU so idle clients are evicted. Setting
+LOGIN_LIMIT_SHARED=1 keeps them in the login_buckets collection instead,
+so every worker draws from the same bucket (one extra round trip, still
+before any bcrypt work).
+"""
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from cachetools import TTLCache
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import MongoDatabase
+
+# Per email: a burst of 5 attempts, refilled at one every 12s (5/minute)
+LOGIN_EMAIL_BURST = float(os.environ.get("LOGIN_EMAIL_BURST", "5"))
+LOGIN_EMAIL_PER_SECOND = float(os.environ.get("LOGIN_EMAIL_PER_SECOND", str(5 / 60)))
+# Per client IP: looser, since schools and offices share addresses
+LOGIN_IP_BURST = float(os.environ.get("LOGIN_IP_BURST", "30"))
+LOGIN_IP_PER_SECOND = float(os.environ.get("LOGIN_IP_PER_SECOND", "1"))
+LOGIN_LIMIT_MAX_KEYS = int(os.environ.get("LOGIN_LIMIT_MAX_KEYS", "100000"))
+LOGIN_LIMIT_SHARED = os.environ.get("LOGIN_LIMIT_SHARED", "0") == "1"
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by string; each key refills at rate/s up to burst"""
+
+    def __init__(self, name: str, burst: float, rate: float, max_keys: int = LOGIN_LIMIT_MAX_KEYS):
+        self.name = name
+        self.burst = burst
+        self.rate = rate
+        # A bucket that has been idle long enough to refill completely carries no state
+        idle_ttl = max(1.0, burst / rate) if rate > 0 else 3600
+        self._buckets = TTLCache(maxsize=max_keys, ttl=idle_ttl)
+        self.admitted = 0
+        self.rejected = 0
+
+    def _record(self, allowed: bool) -> bool:
+        if allowed:
+            self.admitted += 1
+        else:
+            self.rejected += 1
+        return allowed
+
+    def try_acquire(self, key: str) -> bool:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return self._record(allowed)
+
+    async def try_acquire_shared(self, db: MongoDatabase, key: str) -> bool:
+        """Same bucket arithmetic done atomically in Mongo with an update pipeline"""
+        now = datetime.now(timezone.utc)
+        refilled = {"$min": [
+            self.burst,
+            {"$add": [
+                "$tokens",
+                {"$multiply": [{"$divide": [{"$subtract": [now, "$updated_at"]}, 1000]}, self.rate]}
+            ]}
+        ]}
+        bucket_id = f"{self.name}:{key}"
+        pipeline = [
+            {"$set": {
+                "tokens": {"$ifNull": ["$tokens", self.burst]},
+                "updated_at": {"$ifNull": ["$updated_at", now]}
+            }},
+            {"$set": {"tokens": refilled, "updated_at": now}},
+            {"$set": {
+                "allowed": {"$gte": ["$tokens", 1]},
+                "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "expires_at": now + timedelta(seconds=self.burst / self.rate if self.rate > 0 else 3600)
+            }}
+        ]
+        try:
+            doc = await db.login_buckets.find_one_and_update(
+                {"_id": bucket_id}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Two workers raced to create the bucket; the retry finds it
+            doc = await db.login_buckets.find_one_and_update(
+                {"_id": bucket_id}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        return self._record(doc["allowed"])
+
+    def stats(self) -> dict:
+        return {
+            "burst": self.burst,
+            "per_second": self.rate,
+            "tracked_keys": len(self._buckets),
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
+
+
+login_email_limiter = TokenBucketLimiter("email", LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_SECOND)
+login_ip_limiter = TokenBucketLimiter("ip", LOGIN_IP_BURST, LOGIN_IP_PER_SECOND)
+
+
+async def admit_login(db: MongoDatabase, email: str, client_ip: Optional[str]):
+    """Raise 429 before any password hashing if this client or account is over its budget"""
+    # IP first, so one client spraying many accounts does not drain their email buckets
+    checks = [(login_ip_limiter, client_ip)] if client_ip else []
+    checks.append((login_email_limiter, email.strip().lower()))
+    for limiter, key in checks:
+        if LOGIN_LIMIT_SHARED:
+            allowed = await limiter.try_acquire_shared(db, key)
+        else:
+            allowed = limiter.try_acquire(key)
+        if not allowed:
+            retry_after = max(1, int(1 / limiter.rate)) if limiter.rate > 0 else 60
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts, please try again later",
+                headers={"Retry-After": str(retry_after)}
+            )
+
+
+def login_limit_stats() -> dict:
+    return {
+        "shared": LOGIN_LIMIT_SHARED,
+        "email": login_email_limiter.stats(),
+        "ip": login_ip_limiter.stats()
+    }
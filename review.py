@@ -0,0 +1,64 @@
+"""Atomic review updates for user_progress
+
+Each review is one find_one_and_update with an update pipeline (built by
+scheduler.py) and upsert=True: the new state is computed by the server from
+the stored document, so a double-submitted review can no longer overwrite a
+concurrent one.
+
+The round trip returns the card as it was before the review, which tells
+callers whether it was learned; scheduler.Scheduler.review() replays the
+review on it to get the new state.
+"""
+from typing import Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Review interval (days) at which each level 0..5 starts (5 = mastered)
+LEVEL_INTERVAL_DAYS = [0, 1, 3, 7, 15, 30]
+MAX_LEVEL = len(LEVEL_INTERVAL_DAYS) - 1
+
+# Mastery from which a card counts as learned
+LEARNED_MASTERY = 50
+
+# Whether a stored card counts towards users.words_learned, for either schema
+LEARNED_QUERY = {"$or": [
+    {"learned": True},
+    {"learned": {"$exists": False}, "mastery": {"$gte": LEARNED_MASTERY}}
+]}
+
+
+# Pipeline twin of was_learned, evaluated on the stored card
+WAS_LEARNED_EXPR = {"$cond": [
+    {"$eq": [{"$ifNull": ["$learned", None]}, None]},
+    {"$gte": [{"$ifNull": ["$mastery", 0]}, LEARNED_MASTERY]},
+    "$learned"
+]}
+
+
+def was_learned(card: Optional[dict]) -> bool:
+    """Python twin of LEARNED_QUERY"""
+    card = card or {}
+    if card.get("learned") is not None:
+        return bool(card["learned"])
+    return (card.get("mastery") or 0) >= LEARNED_MASTERY
+
+
+async def apply_review(collection, user_id: str, word_id: str, pipeline: list) -> Optional[dict]:
+    """Apply a review pipeline to (user_id, word_id), creating the card if needed; returns the document before it, None if new"""
+    query = {"user_id": user_id, "word_id": word_id}
+    try:
+        return await collection.find_one_and_update(
+            query, pipeline, {"_id": 0}, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # A concurrent first review inserted the card; the retry updates it
+        return await collection.find_one_and_update(
+            query, pipeline, {"_id": 0}, return_document=ReturnDocument.BEFORE
+        )
+
+
+def learned_delta(before: Optional[dict], after: dict) -> int:
+    """+1 / -1 when the review crossed the learned threshold, else 0"""
+    return int(bool(after.get("learned"))) - int(was_learned(before))
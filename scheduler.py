@@ -0,0 +1,389 @@
+"""Spaced-repetition schedulers for user_progress
+
+Every card is stored in one schema (schema_version 2):
+
+    interval_days, ease, stability, difficulty, repetitions   scheduler state
+    review_count, correct_count, incorrect_count               counters
+    mastery, level, learned                                     derived from interval_days
+
+`mastery`, `level` and `learned` are kept so existing clients and the
+teacher views read the same fields as before. Cards written by the old
+level/learned and mastery/interval_days code are normalized on their next
+review (and in bulk by migrate_progress.py).
+
+A scheduler has two equivalent forms: `schedule()`, a pure NumPy function
+that reviews a whole batch of cards in one call, and `pipeline_stages()`,
+the same arithmetic as an update pipeline so a single review stays one
+atomic round trip. SCHEDULER selects the algorithm (sm2 or fsrs); both keep
+`stability` in step, so switching it keeps every card's progress.
+
+A card is learned from a 30-day interval: level 5 and mastery 50, the
+thresholds the old level and mastery code used.
+"""
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from review import (DAY_MS, LEARNED_MASTERY, LEVEL_INTERVAL_DAYS, MAX_LEVEL, WAS_LEARNED_EXPR, apply_review,
+                    was_learned)
+
+SCHEMA_VERSION = 2
+STATE_FIELDS = ("interval_days", "ease", "stability", "difficulty", "repetitions")
+
+MAX_INTERVAL_DAYS = float(os.environ.get("SCHEDULER_MAX_INTERVAL_DAYS", "365"))
+# Interval at which mastery reaches 100
+MASTERY_FULL_INTERVAL_DAYS = 60.0
+# A card counts as learned from this interval on: mastery 50 and level 5
+LEARNED_INTERVAL_DAYS = MASTERY_FULL_INTERVAL_DAYS * LEARNED_MASTERY / 100
+
+DEFAULT_EASE = 2.5
+DEFAULT_DIFFICULTY = 5.0
+
+# Pipeline-only scratch fields, removed before the document is stored
+_TEMP_FIELDS = ["_elapsed_days", "_retrievability", "_new_card"]
+
+
+def _round(x):
+    """Half-up rounding, identical in NumPy and in the pipeline"""
+    return np.floor(x + 0.5)
+
+
+def _round_expr(x) -> dict:
+    return {"$floor": {"$add": [x, 0.5]}}
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Motor returns naive datetimes in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+# ==================== CARD STATE ====================
+
+def new_card(user_id: str, word_id: str, category_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "word_id": word_id,
+        "category_id": category_id,
+        "progress_id": f"prog_{user_id[:8]}_{word_id[:8]}"
+    }
+
+
+def card_state(card: Optional[dict]) -> Dict[str, float]:
+    """Scheduler state of a stored card, with defaults for cards in the old schemas"""
+    card = card or {}
+    interval = card.get("interval_days")
+    if interval is None:
+        level = card.get("level")
+        interval = LEVEL_INTERVAL_DAYS[min(max(level, 0), MAX_LEVEL)] if level is not None else 0
+    repetitions = card.get("repetitions")
+    if repetitions is None:
+        repetitions = 0 if interval <= 0 else 1 if interval < 6 else 2
+    stability = card.get("stability")
+    return {
+        "interval_days": float(interval),
+        "ease": float(card.get("ease") or DEFAULT_EASE),
+        # Seeded from the interval for cards no scheduler has tracked stability for
+        "stability": float(interval if stability is None else stability),
+        "difficulty": float(card.get("difficulty") or DEFAULT_DIFFICULTY),
+        "repetitions": float(repetitions)
+    }
+
+
+def derive(interval_days: np.ndarray):
+    """(mastery, level, learned) arrays for the given intervals"""
+    mastery = np.minimum(100.0, interval_days / MASTERY_FULL_INTERVAL_DAYS * 100)
+    level = np.searchsorted(np.asarray(LEVEL_INTERVAL_DAYS[1:], dtype=float), interval_days, side="right")
+    return mastery, level, interval_days >= LEARNED_INTERVAL_DAYS
+
+
+def _state_exprs(now: datetime) -> List[dict]:
+    """Pipeline stages normalizing the stored card the same way as card_state()"""
+    level_interval = {"$cond": [
+        {"$eq": [{"$ifNull": ["$level", None]}, None]},
+        0,
+        {"$arrayElemAt": [LEVEL_INTERVAL_DAYS, {"$min": [{"$max": ["$level", 0]}, MAX_LEVEL]}]}
+    ]}
+    return [
+        {"$set": {
+            "interval_days": {"$ifNull": ["$interval_days", level_interval]},
+            "ease": {"$ifNull": ["$ease", DEFAULT_EASE]},
+            "difficulty": {"$ifNull": ["$difficulty", DEFAULT_DIFFICULTY]},
+            "_elapsed_days": {"$max": [0, {"$divide": [
+                {"$subtract": [now, {"$ifNull": ["$last_reviewed", now]}]}, DAY_MS
+            ]}]}
+        }},
+        {"$set": {
+            "repetitions": {"$ifNull": ["$repetitions", {"$switch": {
+                "branches": [
+                    {"case": {"$lte": ["$interval_days", 0]}, "then": 0},
+                    {"case": {"$lt": ["$interval_days", 6]}, "then": 1}
+                ],
+                "default": 2
+            }}]},
+            "stability": {"$ifNull": ["$stability", "$interval_days"]}
+        }}
+    ]
+
+
+def _derived_exprs(now: datetime, correct: bool) -> dict:
+    learned = {"$gte": ["$interval_days", LEARNED_INTERVAL_DAYS]}
+    if correct:
+        # Evaluated against the stored learned / mastery, which this stage overwrites
+        learned = {"$or": [learned, WAS_LEARNED_EXPR]}
+    return {
+        "mastery": {"$min": [100, {"$multiply": [{"$divide": ["$interval_days", MASTERY_FULL_INTERVAL_DAYS]}, 100]}]},
+        "level": {"$add": [{"$cond": [{"$gte": ["$interval_days", days]}, 1, 0]} for days in LEVEL_INTERVAL_DAYS[1:]]},
+        "learned": learned,
+        "next_review": {"$add": [now, {"$multiply": ["$interval_days", DAY_MS]}]}
+    }
+
+
+# ==================== SCHEDULERS ====================
+
+class Scheduler:
+    """Computes the next state of reviewed cards; subclasses implement one algorithm"""
+
+    name = ""
+
+    def schedule(self, state: Dict[str, np.ndarray], correct: np.ndarray,
+                 elapsed_days: np.ndarray) -> Dict[str, np.ndarray]:
+        """New STATE_FIELDS arrays for a batch of cards, one review each"""
+        raise NotImplementedError
+
+    def pipeline_stages(self, correct: bool) -> List[dict]:
+        """Update-pipeline stages doing what schedule() does for one card"""
+        raise NotImplementedError
+
+    def review_pipeline(self, user_id: str, word_id: str, category_id: str, correct: bool,
+                        now: datetime) -> list:
+        """Full update pipeline for one review, for review.apply_review()"""
+        defaults = new_card(user_id, word_id, category_id)
+        return [
+            {"$set": {
+                "correct_count": {"$add": [{"$ifNull": ["$correct_count", 0]}, 1 if correct else 0]},
+                "incorrect_count": {"$add": [{"$ifNull": ["$incorrect_count", 0]}, 0 if correct else 1]},
+                # Compare-and-set token for writers that compute the new state client-side
+                "review_count": {"$add": [{"$ifNull": ["$review_count", 0]}, 1]},
+                "progress_id": {"$ifNull": ["$progress_id", defaults["progress_id"]]},
+                "category_id": {"$ifNull": ["$category_id", category_id]},
+                "created_at": {"$ifNull": ["$created_at", now]}
+            }},
+            *_state_exprs(now),
+            *self.pipeline_stages(correct),
+            {"$set": {
+                **_derived_exprs(now, correct),
+                "last_reviewed": now,
+                "updated_at": now,
+                "schema_version": SCHEMA_VERSION
+            }},
+            {"$unset": _TEMP_FIELDS}
+        ]
+
+    async def review(self, collection, user_id: str, word_id: str, category_id: str, correct: bool,
+                     now: datetime):
+        """Apply one review atomically; returns (card before, card after), before is None for a new card
+
+        The stored result is computed by the server; replaying the same review
+        on the card it ran on gives the same document without returning it.
+        """
+        before = await apply_review(collection, user_id, word_id,
+                                    self.review_pipeline(user_id, word_id, category_id, correct, now))
+        card = before or new_card(user_id, word_id, category_id)
+        return before, self.review_cards([card], [correct], [now])[0]
+
+    def review_cards(self, cards: Sequence[dict], correct: Sequence[bool],
+                     reviewed_at: Sequence[datetime]) -> List[dict]:
+        """Review a batch of distinct cards in one vectorized call; returns the new documents"""
+        states = [card_state(card) for card in cards]
+        arrays = {field: np.array([s[field] for s in states], dtype=float) for field in STATE_FIELDS}
+        elapsed = np.array([
+            max(0.0, (_as_utc(t) - _as_utc(card["last_reviewed"])).total_seconds() / 86400)
+            if card.get("last_reviewed") else 0.0
+            for card, t in zip(cards, reviewed_at)
+        ])
+        new = self.schedule(arrays, np.asarray(correct, dtype=bool), elapsed)
+        mastery, level, learned = derive(new["interval_days"])
+
+        reviewed = []
+        for i, card in enumerate(cards):
+            now = reviewed_at[i]
+            ok = bool(correct[i])
+            doc = {k: v for k, v in card.items() if k not in _TEMP_FIELDS}
+            doc.update({field: float(new[field][i]) for field in STATE_FIELDS})
+            doc.update({
+                "repetitions": int(new["repetitions"][i]),
+                "correct_count": card.get("correct_count", 0) + (1 if ok else 0),
+                "incorrect_count": card.get("incorrect_count", 0) + (0 if ok else 1),
+                "review_count": card.get("review_count", 0) + 1,
+                "mastery": float(mastery[i]),
+                "level": int(level[i]),
+                # A correct answer never unlearns a card, e.g. an old-schema mastery 50 one on a short interval
+                "learned": bool(learned[i]) or (ok and was_learned(card)),
+                "last_reviewed": now,
+                "next_review": now + timedelta(days=float(new["interval_days"][i])),
+                "created_at": card.get("created_at") or now,
+                "updated_at": now,
+                "schema_version": SCHEMA_VERSION
+            })
+            reviewed.append(doc)
+        return reviewed
+
+
+class SM2Scheduler(Scheduler):
+    """SuperMemo-2 with pass/fail answers mapped to quality 4 / 1"""
+
+    name = "sm2"
+    QUALITY_CORRECT = 4
+    QUALITY_INCORRECT = 1
+    MIN_EASE = 1.3
+
+    @staticmethod
+    def _ease_delta(quality):
+        return 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+
+    def schedule(self, state, correct, elapsed_days):
+        quality = np.where(correct, self.QUALITY_CORRECT, self.QUALITY_INCORRECT)
+        repetitions = np.where(correct, state["repetitions"] + 1, 0)
+        grown = _round(state["interval_days"] * state["ease"])
+        interval = np.minimum(np.where(correct, np.select([repetitions == 1, repetitions == 2], [1, 6], grown), 1),
+                              MAX_INTERVAL_DAYS).astype(float)
+        return {
+            "interval_days": interval,
+            "ease": np.maximum(self.MIN_EASE, state["ease"] + self._ease_delta(quality)),
+            # Kept in step so a switch to FSRS continues from the current interval
+            "stability": interval,
+            "difficulty": state["difficulty"],
+            "repetitions": repetitions.astype(float)
+        }
+
+    def pipeline_stages(self, correct):
+        quality = self.QUALITY_CORRECT if correct else self.QUALITY_INCORRECT
+        ease = {"$max": [self.MIN_EASE, {"$add": ["$ease", self._ease_delta(quality)]}]}
+        if not correct:
+            return [{"$set": {"repetitions": 0, "interval_days": 1, "stability": 1, "ease": ease}}]
+        return [
+            {"$set": {"repetitions": {"$add": ["$repetitions", 1]}}},
+            {"$set": {
+                "interval_days": {"$min": [MAX_INTERVAL_DAYS, {"$switch": {
+                    "branches": [
+                        {"case": {"$eq": ["$repetitions", 1]}, "then": 1},
+                        {"case": {"$eq": ["$repetitions", 2]}, "then": 6}
+                    ],
+                    "default": _round_expr({"$multiply": ["$interval_days", "$ease"]})
+                }}]},
+                "ease": ease
+            }},
+            {"$set": {"stability": "$interval_days"}}
+        ]
+
+
+class FSRSScheduler(Scheduler):
+    """FSRS-4.5 memory model with pass/fail answers mapped to Good / Again"""
+
+    name = "fsrs"
+    WEIGHTS = [0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+               0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755]
+    GRADE_AGAIN = 1
+    GRADE_GOOD = 3
+    DECAY = -0.5
+    FACTOR = 19 / 81
+
+    def __init__(self, desired_retention: float = float(os.environ.get("FSRS_DESIRED_RETENTION", "0.9"))):
+        w = self.WEIGHTS
+        self.desired_retention = desired_retention
+        # Days of interval per day of stability at the desired retention
+        self.interval_factor = (desired_retention ** (1 / self.DECAY) - 1) / self.FACTOR
+        self.initial_stability = {self.GRADE_AGAIN: w[0], self.GRADE_GOOD: w[2]}
+        self.success_factor = math.exp(w[8])
+
+    def _initial_difficulty(self, grade: int) -> float:
+        w = self.WEIGHTS
+        return w[4] - (grade - 3) * w[5]
+
+    def _next_difficulty(self, grade: int):
+        """(multiplier, offset): D' = multiplier * D + offset, before clamping to [1, 10]"""
+        w = self.WEIGHTS
+        # Mean reversion towards the initial difficulty of a Good answer
+        return 1 - w[7], w[7] * self._initial_difficulty(self.GRADE_GOOD) - (1 - w[7]) * w[6] * (grade - 3)
+
+    def schedule(self, state, correct, elapsed_days):
+        w = self.WEIGHTS
+        stability, difficulty = state["stability"], state["difficulty"]
+        new_card = stability <= 0
+        s = np.where(new_card, 1.0, stability)
+        retrievability = np.where(new_card, 1.0, (1 + self.FACTOR * elapsed_days / s) ** self.DECAY)
+
+        recalled = s * (1 + self.success_factor * (11 - difficulty) * s ** -w[9]
+                        * (np.exp(w[10] * (1 - retrievability)) - 1))
+        forgotten = np.minimum(s, w[11] * difficulty ** -w[12] * ((s + 1) ** w[13] - 1)
+                               * np.exp(w[14] * (1 - retrievability)))
+        initial = np.where(correct, self.initial_stability[self.GRADE_GOOD], self.initial_stability[self.GRADE_AGAIN])
+        stability = np.where(new_card, initial, np.where(correct, recalled, forgotten))
+
+        good_m, good_b = self._next_difficulty(self.GRADE_GOOD)
+        again_m, again_b = self._next_difficulty(self.GRADE_AGAIN)
+        reverted = np.where(correct, good_m * difficulty + good_b, again_m * difficulty + again_b)
+        first = np.where(correct, self._initial_difficulty(self.GRADE_GOOD), self._initial_difficulty(self.GRADE_AGAIN))
+        difficulty = np.clip(np.where(new_card, first, reverted), 1, 10)
+
+        interval = np.clip(_round(stability * self.interval_factor), 1, MAX_INTERVAL_DAYS)
+        return {
+            "interval_days": interval,
+            "ease": state["ease"],
+            "stability": stability,
+            "difficulty": difficulty,
+            "repetitions": np.where(correct, state["repetitions"] + 1, 0).astype(float)
+        }
+
+    def pipeline_stages(self, correct):
+        w = self.WEIGHTS
+        grade = self.GRADE_GOOD if correct else self.GRADE_AGAIN
+        one_minus_r = {"$subtract": [1, "$_retrievability"]}
+        if correct:
+            reviewed = {"$multiply": ["$stability", {"$add": [1, {"$multiply": [
+                self.success_factor,
+                {"$subtract": [11, "$difficulty"]},
+                {"$pow": ["$stability", -w[9]]},
+                {"$subtract": [{"$exp": {"$multiply": [w[10], one_minus_r]}}, 1]}
+            ]}]}]}
+        else:
+            reviewed = {"$min": ["$stability", {"$multiply": [
+                w[11],
+                {"$pow": ["$difficulty", -w[12]]},
+                {"$subtract": [{"$pow": [{"$add": ["$stability", 1]}, w[13]]}, 1]},
+                {"$exp": {"$multiply": [w[14], one_minus_r]}}
+            ]}]}
+        multiplier, offset = self._next_difficulty(grade)
+        return [
+            {"$set": {"_new_card": {"$lte": ["$stability", 0]}}},
+            {"$set": {"_retrievability": {"$cond": [
+                "$_new_card",
+                1,
+                {"$pow": [{"$add": [1, {"$divide": [{"$multiply": [self.FACTOR, "$_elapsed_days"]}, "$stability"]}]},
+                          self.DECAY]}
+            ]}}},
+            {"$set": {
+                "stability": {"$cond": ["$_new_card", self.initial_stability[grade], reviewed]},
+                "difficulty": {"$min": [10, {"$max": [1, {"$cond": [
+                    "$_new_card",
+                    self._initial_difficulty(grade),
+                    {"$add": [{"$multiply": [multiplier, "$difficulty"]}, offset]}
+                ]}]}]},
+                "repetitions": {"$add": ["$repetitions", 1]} if correct else 0
+            }},
+            {"$set": {
+                "interval_days": {"$min": [MAX_INTERVAL_DAYS, {"$max": [
+                    1, _round_expr({"$multiply": ["$stability", self.interval_factor]})
+                ]}]}
+            }}
+        ]
+
+
+SCHEDULERS = {cls.name: cls for cls in (SM2Scheduler, FSRSScheduler)}
+
+SCHEDULER = os.environ.get("SCHEDULER", "sm2")
+if SCHEDULER not in SCHEDULERS:
+    raise ValueError(f"SCHEDULER must be one of {', '.join(SCHEDULERS)}, got {SCHEDULER!r}")
+
+scheduler = SCHEDULERS[SCHEDULER]()
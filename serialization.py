@@ -0,0 +1,53 @@
+"""Fast read-path serialization for documents this API wrote itself
+
+Documents coming back from Mongo were validated when they were written, so
+read endpoints skip Pydantic re-validation: models are built with
+model_construct, or raw dicts go straight to orjson. Run
+`python bench_serialization.py` to compare per-row costs.
+"""
+from datetime import datetime
+from typing import Type, TypeVar
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+    import json
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """Encode plain dicts/lists (datetimes as ISO 8601) to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that skips jsonable_encoder; content must be plain dicts/lists"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def trusted(model: Type[ModelT], doc: dict) -> ModelT:
+    """Build a model from a stored document without re-validating it"""
+    return model.model_construct(**doc)
@@ -1,8 +1,7 @@
-from fastapi import FastAPI, APIRouter, Request, HTTPException, Response
+from fastapi import FastAPI, APIRouter, Request, HTTPException, Response, Depends
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
@@ -18,20 +17,30 @@ from models import (
 from auth import (
     get_session_data, create_or_update_user, create_session,
     get_current_user, require_auth, require_teacher, require_super_admin,
-    authenticate_user, create_access_token, get_password_hash, get_current_user_from_token
+    authenticate_user, create_access_token, get_password_hash, get_current_user_from_token,
+    invalidate_cached_user, user_cache, session_cache, invalidate_session, password_hasher, create_user_token, require_subscription
 )
+from token_versions import token_versions
+from emergent_auth import emergent_auth_client
+from rate_limit import admit_login, login_limit_stats
+from pagination import keyset_page, keyset_cursor, clamp_page_size, WORD_KEYSET
+from streaming import stream_mode, stream_cursor
+from serialization import FastJSONResponse
+from catalogue import catalogue, categories_response, word_page_response
+from dictionary import dictionary
+from loader import get_loaders, loader_stats
+from review import learned_delta
+from scheduler import scheduler
+from words_learned import adjust_words_learned, words_learned_reconciler
 from teacher_management import teacher_router
 from progress import router as progress_router
 from user_content import router as user_content_router
+from database import get_db, connect_to_mongo, close_mongo_connection
+from indexes import ensure_indexes, check_indexes, ENSURE_INDEXES_ON_STARTUP
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
 # Create the main app
 app = FastAPI(title="YLM Sözlük API")
 
@@ -56,7 +65,7 @@ api_router = APIRouter(prefix="/api")
 # ==================== AUTH ENDPOINTS ====================
 
 @api_router.post("/register")
-async def register(body: dict):
+async def register(body: dict, db = Depends(get_db)):
     email = body.get("email")
     password = body.get("password")
     name = body.get("name", email.split("@")[0])
@@ -76,7 +85,7 @@ async def register(body: dict):
         "user_id": user_id,
         "email": email,
         "name": name,
-        "hashed_password": get_password_hash(password),
+        "hashed_password": await get_password_hash(password),
         "role": role,
         "subscription": subscription,
         "language_preference": "tr-ru",
@@ -87,7 +96,7 @@ async def register(body: dict):
     }
     
     await db.users.insert_one(user_data)
-    access_token = create_access_token(data={"sub": email})
+    access_token = create_user_token(user_id, email, role, subscription)
     
     return {
         "token": access_token,
@@ -101,18 +110,19 @@ async def register(body: dict):
     }
 
 @api_router.post("/login")
-async def login(body: dict):
+async def login(request: Request, body: dict, db = Depends(get_db)):
     email = body.get("email")
     password = body.get("password")
     
     if not email or not password:
         raise HTTPException(status_code=400, detail="Email and password required")
     
+    await admit_login(db, email, request.client.host if request.client else None)
     user = await authenticate_user(email, password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    access_token = create_access_token(data={"sub": email})
+    access_token = create_user_token(user.user_id, user.email, user.role, user.subscription)
     
     return {
         "token": access_token,
@@ -180,9 +190,10 @@ async def get_me(request: Request):
     return user
 
 @api_router.post("/auth/logout")
-async def logout(request: Request, response: Response):
+async def logout(request: Request, response: Response, db = Depends(get_db)):
     session_token = request.cookies.get("session_token")
     if session_token:
+        invalidate_session(session_token)
         await db.user_sessions.delete_one({"session_token": session_token})
     response.delete_cookie("session_token", path="/")
     return {"message": "Logged out successfully"}
@@ -190,13 +201,16 @@ async def logout(request: Request, response: Response):
 # ==================== SUPER ADMIN ENDPOINTS ====================
 
 @api_router.get("/admin/users")
-async def get_all_users(request: Request):
+async def get_all_users(request: Request, stream: Optional[str] = None, db = Depends(get_db)):
     await require_super_admin(request)
+    mode = stream_mode(request, stream)
+    if mode:
+        return stream_cursor(db.users.find({}, {"_id": 0}), mode)
     users = await db.users.find({}, {"_id": 0}).to_list(1000)
     return users
 
 @api_router.post("/admin/users/teacher")
-async def create_teacher(request: Request, assignment: TeacherAssignment):
+async def create_teacher(request: Request, assignment: TeacherAssignment, db = Depends(get_db)):
     await require_super_admin(request)
     existing_user = await db.users.find_one({"email": assignment.teacher_email}, {"_id": 0})
     
@@ -205,6 +219,8 @@ async def create_teacher(request: Request, assignment: TeacherAssignment):
             {"email": assignment.teacher_email},
             {"$set": {"role": "teacher", "subscription": assignment.subscription}}
         )
+        invalidate_cached_user(existing_user["user_id"])
+        await token_versions.bump(db, existing_user["user_id"])
         user = await db.users.find_one({"email": assignment.teacher_email}, {"_id": 0})
         return User(**user)
     else:
@@ -226,7 +242,7 @@ async def create_teacher(request: Request, assignment: TeacherAssignment):
         return User(**user_data)
 
 @api_router.put("/admin/users/{user_id}/role")
-async def update_user_role(request: Request, user_id: str, body: dict):
+async def update_user_role(request: Request, user_id: str, body: dict, db = Depends(get_db)):
     await require_super_admin(request)
     new_role = body.get("role")
     if new_role not in ["student", "teacher", "super_admin"]:
@@ -238,10 +254,12 @@ async def update_user_role(request: Request, user_id: str, body: dict):
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_cached_user(user_id)
+    await token_versions.bump(db, user_id)
     return {"message": "Role updated successfully"}
 
 @api_router.put("/admin/users/{user_id}/subscription")
-async def update_user_subscription(request: Request, user_id: str, body: dict):
+async def update_user_subscription(request: Request, user_id: str, body: dict, db = Depends(get_db)):
     await require_super_admin(request)
     new_subscription = body.get("subscription")
     if new_subscription not in ["free", "basic", "standard", "premium"]:
@@ -253,19 +271,42 @@ async def update_user_subscription(request: Request, user_id: str, body: dict):
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_cached_user(user_id)
+    await token_versions.bump(db, user_id)
     return {"message": "Subscription updated successfully"}
 
+@api_router.get("/admin/metrics")
+async def get_metrics(request: Request, db = Depends(get_db)):
+    await require_super_admin(request)
+    return {
+        "mongo_pool": db.pool_stats(),
+        "user_cache": user_cache.stats(),
+        "session_cache": session_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "token_versions": token_versions.stats(),
+        "auth_api": emergent_auth_client.stats(),
+        "login_limits": login_limit_stats(),
+        "catalogue": catalogue.stats(),
+        "dictionary": dictionary.stats(),
+        "loaders": loader_stats(),
+        "words_learned_reconciler": words_learned_reconciler.stats()
+    }
+
+@api_router.get("/admin/indexes")
+async def get_index_report(request: Request, db = Depends(get_db)):
+    await require_super_admin(request)
+    return await check_indexes(db)
+
 # ==================== CATEGORY ENDPOINTS ====================
 
 @api_router.get("/categories")
-async def get_categories(request: Request):
+async def get_categories(request: Request, db = Depends(get_db)):
     user = await require_auth(request)
-    categories = await db.categories.find({}, {"_id": 0}).to_list(1000)
-    return [Category(**cat) for cat in categories]
+    return await categories_response(request, db)
 
 @api_router.post("/categories")
-async def create_category(request: Request, category: CategoryCreate):
-    user = await require_teacher(request)
+async def create_category(request: Request, category: CategoryCreate, db = Depends(get_db)):
+    await require_teacher(request)
     category_id = f"cat_{uuid.uuid4().hex[:12]}"
     category_data = {
         **category.model_dump(),
@@ -273,43 +314,61 @@ async def create_category(request: Request, category: CategoryCreate):
         "created_at": datetime.now(timezone.utc)
     }
     await db.categories.insert_one(category_data)
+    await catalogue.bump(db, category_ids=[category_id])
     return Category(**category_data)
 
 @api_router.put("/categories/{category_id}")
-async def update_category(request: Request, category_id: str, category: CategoryCreate):
-    user = await require_teacher(request)
+async def update_category(request: Request, category_id: str, category: CategoryCreate, db = Depends(get_db)):
+    await require_teacher(request)
     result = await db.categories.update_one(
         {"category_id": category_id},
         {"$set": category.model_dump()}
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
+    await catalogue.bump(db, category_ids=[category_id])
     updated = await db.categories.find_one({"category_id": category_id}, {"_id": 0})
     return Category(**updated)
 
 @api_router.delete("/categories/{category_id}")
-async def delete_category(request: Request, category_id: str):
+async def delete_category(request: Request, category_id: str, db = Depends(get_db)):
     await require_super_admin(request)
     result = await db.categories.delete_one({"category_id": category_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Category not found")
     await db.words.delete_many({"category_id": category_id})
+    await catalogue.bump(db, category_ids=[category_id])
     return {"message": "Category deleted successfully"}
 
 # ==================== WORD ENDPOINTS ====================
 
 @api_router.get("/words")
-async def get_words(request: Request, category_id: Optional[str] = None):
+async def get_words(request: Request, category_id: Optional[str] = None, cursor: Optional[str] = None,
+                    limit: Optional[int] = None, stream: Optional[str] = None, db = Depends(get_db)):
     user = await require_auth(request)
     query = {}
     if category_id:
         query["category_id"] = category_id
-    words = await db.words.find(query, {"_id": 0}).to_list(10000)
-    return [Word(**word) for word in words]
+    mode = stream_mode(request, stream)
+    if mode:
+        # Streams everything after the cursor in one response
+        return stream_cursor(
+            keyset_cursor(db.words, query, WORD_KEYSET, cursor, {"_id": 0}),
+            mode, key="words", extra={"next_cursor": None, "has_more": False}
+        )
+    if category_id:
+        # Category pages are identical for every student: serve the cached, precompressed body
+        return await word_page_response(request, db, category_id, cursor, clamp_page_size(limit))
+    page = await keyset_page(db.words, query, WORD_KEYSET, clamp_page_size(limit), cursor, {"_id": 0})
+    return FastJSONResponse({
+        "words": page["items"],
+        "next_cursor": page["next_cursor"],
+        "has_more": page["has_more"]
+    })
 
 @api_router.post("/words")
-async def create_word(request: Request, word: WordCreate):
-    user = await require_teacher(request)
+async def create_word(request: Request, word: WordCreate, db = Depends(get_db)):
+    await require_teacher(request)
     word_id = f"word_{uuid.uuid4().hex[:12]}"
     word_data = {
         **word.model_dump(),
@@ -322,13 +381,15 @@ async def create_word(request: Request, word: WordCreate):
         {"category_id": word.category_id},
         {"$inc": {"word_count": 1}}
     )
+    await catalogue.bump(db, word_ids=[word_id], category_ids=[word.category_id])
     return Word(**word_data)
 
 @api_router.post("/words/ai-example")
 async def generate_ai_example(request: Request, ai_request: AIExampleRequest):
-    user = await require_auth(request)
-    if user.subscription not in ["standard", "premium"] and user.role != "super_admin":
-        raise HTTPException(status_code=403, detail="Premium subscription required for AI features")
+    user = await require_subscription(
+        request, ["standard", "premium"], "Premium subscription required for AI features",
+        allow_roles=("super_admin",)
+    )
     
     api_key = os.environ.get("EMERGENT_LLM_KEY")
     chat = LlmChat(
@@ -353,19 +414,20 @@ async def generate_ai_example(request: Request, ai_request: AIExampleRequest):
     )
 
 @api_router.put("/words/{word_id}")
-async def update_word(request: Request, word_id: str, word: WordCreate):
-    user = await require_teacher(request)
+async def update_word(request: Request, word_id: str, word: WordCreate, db = Depends(get_db)):
+    await require_teacher(request)
     result = await db.words.update_one(
         {"word_id": word_id},
         {"$set": word.model_dump()}
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Word not found")
+    await catalogue.bump(db, word_ids=[word_id])
     updated = await db.words.find_one({"word_id": word_id}, {"_id": 0})
     return Word(**updated)
 
 @api_router.delete("/words/{word_id}")
-async def delete_word(request: Request, word_id: str):
+async def delete_word(request: Request, word_id: str, db = Depends(get_db)):
     await require_super_admin(request)
     word = await db.words.find_one({"word_id": word_id}, {"_id": 0})
     if not word:
@@ -375,12 +437,13 @@ async def delete_word(request: Request, word_id: str):
         {"category_id": word["category_id"]},
         {"$inc": {"word_count": -1}}
     )
+    await catalogue.bump(db, word_ids=[word_id], category_ids=[word["category_id"]])
     return {"message": "Word deleted successfully"}
 
 # ==================== PROGRESS ENDPOINTS ====================
 
 @api_router.get("/progress")
-async def get_progress(request: Request):
+async def get_progress(request: Request, db = Depends(get_db)):
     user = await require_auth(request)
     progress = await db.user_progress.find(
         {"user_id": user.user_id},
@@ -389,67 +452,22 @@ async def get_progress(request: Request):
     return progress
 
 @api_router.post("/progress/{word_id}/review")
-async def review_word(request: Request, word_id: str, body: dict):
+async def review_word(request: Request, word_id: str, body: dict, db = Depends(get_db),
+                      loaders = Depends(get_loaders)):
     user = await require_auth(request)
     correct = body.get("correct", False)
     
-    progress = await db.user_progress.find_one(
-        {"user_id": user.user_id, "word_id": word_id},
-        {"_id": 0}
+    word = await loaders.words.load(word_id)
+    before, progress = await scheduler.review(
+        db.user_progress, user.user_id, word_id, word.get("category_id", "") if word else "",
+        correct, datetime.now(timezone.utc)
     )
     
-    if not progress:
-        progress = {
-            "user_id": user.user_id,
-            "word_id": word_id,
-            "last_reviewed": datetime.now(timezone.utc),
-            "next_review": datetime.now(timezone.utc) + timedelta(days=1),
-            "correct_count": 1 if correct else 0,
-            "incorrect_count": 0 if correct else 1,
-            "mastery": 10 if correct else 0,
-            "interval_days": 1
-        }
-        await db.user_progress.insert_one(progress)
-    else:
-        interval = progress.get("interval_days", 1)
-        if correct:
-            new_interval = min(interval * 2, 30)
-            mastery_change = 10
-        else:
-            new_interval = 1
-            mastery_change = -5
-        
-        new_mastery = max(0, min(100, progress.get("mastery", 0) + mastery_change))
-        next_review = datetime.now(timezone.utc) + timedelta(days=new_interval)
-        
-        await db.user_progress.update_one(
-            {"user_id": user.user_id, "word_id": word_id},
-            {
-                "$set": {
-                    "last_reviewed": datetime.now(timezone.utc),
-                    "next_review": next_review,
-                    "interval_days": new_interval,
-                    "mastery": new_mastery
-                },
-                "$inc": {
-                    "correct_count": 1 if correct else 0,
-                    "incorrect_count": 0 if correct else 1
-                }
-            }
-        )
-    
-    words_learned = await db.user_progress.count_documents({
-        "user_id": user.user_id,
-        "mastery": {"$gte": 50}
-    })
-    await db.users.update_one(
-        {"user_id": user.user_id},
-        {"$set": {"words_learned": words_learned}}
-    )
-    return {"message": "Progress updated", "correct": correct}
+    await adjust_words_learned(db, user, learned_delta(before, progress))
+    return {"message": "Progress updated", "correct": correct, "progress": progress}
 
 @api_router.get("/progress/due")
-async def get_due_words(request: Request):
+async def get_due_words(request: Request, db = Depends(get_db)):
     user = await require_auth(request)
     due_progress = await db.user_progress.find(
         {
@@ -473,8 +491,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_client():
+    app.state.mongo = connect_to_mongo()
+    if ENSURE_INDEXES_ON_STARTUP:
+        await ensure_indexes(app.state.mongo)
+    await password_hasher.configure_cost()
+    await token_versions.start(app.state.mongo)
+    await emergent_auth_client.start()
+    await catalogue.start(app.state.mongo)
+    await dictionary.current(app.state.mongo)
+    await words_learned_reconciler.start(app.state.mongo)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    await token_versions.stop()
+    await catalogue.stop()
+    await words_learned_reconciler.stop()
+    await emergent_auth_client.close()
+    close_mongo_connection()
+    password_hasher.shutdown()
 
 logger.info("YLM Sözlük API started successfully")
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""Dictionary snapshot in a memory-mapped file shared by all uvicorn workers
+
+Set DICTIONARY_SNAPSHOT_PATH to switch `dictionary.dictionary` to this
+implementation. The first worker that sees a newer catalogue version takes
+an flock on `<path>.lock`, rebuilds the file (incrementally from the previous
+file when the change log allows) and renames it into place; the others map
+the new file read-only. N workers hold one copy in the page cache, and a
+worker that starts after the file exists is warm immediately.
+
+File layout (little-endian):
+
+    header   magic "YLMD", format, catalogue version,
+             (count, index offset) for the words, categories and
+             category -> word ids tables, string table offset
+    indexes  per table, fixed-width (key offset, key length, value offset,
+             value length) entries sorted by key bytes
+    strings  utf-8 keys and JSON values
+
+Lookups binary-search an index and decode only the value they return.
+Datetimes come back as ISO 8601 strings.
+"""
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from catalogue import catalogue
+from database import MongoDatabase
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"YLMD"
+FORMAT_VERSION = 1
+WORDS, CATEGORIES, CATEGORY_WORDS = 0, 1, 2
+HEADER = struct.Struct("<4sIQ" + "IQ" * 3 + "Q")
+ENTRY = struct.Struct("<QIQI")
+
+
+def write_snapshot(path: str, version: int, words: Dict[str, dict], categories: Dict[str, dict],
+                   words_by_category: Dict[str, List[str]]) -> int:
+    """Write the snapshot to a temporary file and atomically rename it over `path`"""
+    tables = [words, categories, words_by_category]
+    strings = bytearray()
+    indexes = []
+    for table in tables:
+        entries = []
+        keys = sorted((key.encode() for key in table if isinstance(key, str)))
+        for key in keys:
+            value = dumps(table[key.decode()])
+            entries.append(ENTRY.pack(len(strings), len(key), len(strings) + len(key), len(value)))
+            strings += key
+            strings += value
+        indexes.append(entries)
+
+    offset = HEADER.size
+    counts_offsets = []
+    for entries in indexes:
+        counts_offsets += [len(entries), offset]
+        offset += len(entries) * ENTRY.size
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, version, *counts_offsets, offset)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for entries in indexes:
+            f.write(b"".join(entries))
+        f.write(strings)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return offset + len(strings)
+
+
+class MappedSnapshot:
+    """Read-only view of one snapshot file; stays valid after the file is replaced"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{path} is not a dictionary snapshot")
+        fields = HEADER.unpack_from(self._mm, 0)
+        magic, fmt, self.version = fields[:3]
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a dictionary snapshot")
+        self._tables = [(fields[3 + 2 * i], fields[4 + 2 * i]) for i in range(3)]
+        self._strings = fields[9]
+        self.size = len(self._mm)
+
+    def _entry(self, table: int, i: int) -> Tuple[int, int, int, int]:
+        _, index_offset = self._tables[table]
+        return ENTRY.unpack_from(self._mm, index_offset + i * ENTRY.size)
+
+    def _key(self, key_offset: int, key_len: int) -> bytes:
+        start = self._strings + key_offset
+        return self._mm[start:start + key_len]
+
+    def _find(self, table: int, key: str) -> Optional[bytes]:
+        target = key.encode()
+        lo, hi = 0, self._tables[table][0]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key_offset, key_len, value_offset, value_len = self._entry(table, mid)
+            probe = self._key(key_offset, key_len)
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                start = self._strings + value_offset
+                return self._mm[start:start + value_len]
+        return None
+
+    def items(self, table: int) -> Iterator[Tuple[str, object]]:
+        for i in range(self._tables[table][0]):
+            key_offset, key_len, value_offset, value_len = self._entry(table, i)
+            start = self._strings + value_offset
+            yield self._key(key_offset, key_len).decode(), loads(self._mm[start:start + value_len])
+
+    def count(self, table: int) -> int:
+        return self._tables[table][0]
+
+    def word(self, word_id: str) -> Optional[dict]:
+        raw = self._find(WORDS, word_id) if word_id else None
+        return loads(raw) if raw is not None else None
+
+    def category(self, category_id: str) -> Optional[dict]:
+        raw = self._find(CATEGORIES, category_id) if category_id else None
+        return loads(raw) if raw is not None else None
+
+    def category_words(self, category_id: str) -> List[dict]:
+        raw = self._find(CATEGORY_WORDS, category_id) if category_id else None
+        if raw is None:
+            return []
+        return [word for word in (self.word(word_id) for word_id in loads(raw)) if word is not None]
+
+
+class SharedDictionary:
+    """Same interface as DictionarySnapshot, backed by a shared memory-mapped file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._view: Optional[MappedSnapshot] = None
+        self._lock = asyncio.Lock()
+        self.maps = 0
+        self.rebuilds = 0
+        self.full_rebuilds = 0
+        self.last_rebuild_ms = 0.0
+
+    @property
+    def version(self) -> int:
+        return self._view.version if self._view is not None else -1
+
+    async def current(self, db: MongoDatabase) -> MappedSnapshot:
+        """The mapped snapshot, remapped or rebuilt first if the catalogue version has moved"""
+        if self.version < catalogue.version:
+            async with self._lock:
+                if self.version < catalogue.version:
+                    await self._refresh(db)
+        return self._view
+
+    def _open(self) -> Optional[MappedSnapshot]:
+        try:
+            return MappedSnapshot(self.path)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logger.warning(f"Ignoring dictionary snapshot: {e}")
+            return None
+
+    def _map(self, view: MappedSnapshot):
+        # Views still held by in-flight requests are unmapped when they are collected
+        self._view = view
+        self.maps += 1
+
+    async def _refresh(self, db: MongoDatabase):
+        target = catalogue.version
+        view = self._open()
+        if view is not None and view.version >= target:
+            self._map(view)
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, fcntl.flock, lock_fd, fcntl.LOCK_EX)
+            # Another worker may have written a fresh file while we waited for the lock
+            view = self._open()
+            if view is None or view.version < target:
+                view = await self._rebuild(db, view)
+            self._map(view)
+        finally:
+            os.close(lock_fd)
+
+    async def _rebuild(self, db: MongoDatabase, base: Optional[MappedSnapshot]) -> MappedSnapshot:
+        from dictionary import DictionarySnapshot
+        started = time.perf_counter()
+        builder = DictionarySnapshot()
+        if base is not None:
+            builder.seed(base.version, dict(base.items(WORDS)), dict(base.items(CATEGORIES)))
+        await builder.current(db)
+        # Serialising and fsyncing a large catalogue would stall every request on this worker
+        await asyncio.get_running_loop().run_in_executor(
+            None, write_snapshot, self.path, builder.version, builder.words_by_id,
+            builder.categories_by_id, builder.words_by_category)
+        self.rebuilds += 1
+        self.full_rebuilds += builder.full_reloads
+        self.last_rebuild_ms = round((time.perf_counter() - started) * 1000, 2)
+        return MappedSnapshot(self.path)
+
+    def stats(self) -> dict:
+        view = self._view
+        return {
+            "version": self.version,
+            "path": self.path,
+            "words": view.count(WORDS) if view else 0,
+            "categories": view.count(CATEGORIES) if view else 0,
+            # Shared between workers through the page cache
+            "mapped_bytes": view.size if view else 0,
+            "maps": self.maps,
+            "rebuilds": self.rebuilds,
+            "full_rebuilds": self.full_rebuilds,
+            "last_rebuild_ms": self.last_rebuild_ms
+        }
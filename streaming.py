@@ -0,0 +1,73 @@
+"""Incremental JSON / NDJSON responses over Motor cursors
+
+Collection endpoints accept `?stream=ndjson` (or `Accept: application/x-ndjson`)
+for one document per line, or `?stream=json` for the regular response body
+written incrementally. Either way the cursor is drained in batches, so
+time-to-first-byte and memory do not depend on the result size.
+"""
+import os
+from typing import Optional
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from serialization import dumps as encode_json
+
+STREAM_BATCH_SIZE = int(os.environ.get("STREAM_BATCH_SIZE", "500"))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_MODES = ("ndjson", "json")
+
+
+def stream_mode(request: Request, stream: Optional[str]) -> Optional[str]:
+    """Requested streaming mode, from ?stream= or the Accept header"""
+    if stream:
+        if stream not in STREAM_MODES:
+            raise HTTPException(status_code=400, detail=f"stream must be one of {', '.join(STREAM_MODES)}")
+        return stream
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return "ndjson"
+    return None
+
+
+async def _ndjson_chunks(cursor, batch_size: int):
+    buffer = []
+    async for doc in cursor:
+        buffer.append(encode_json(doc))
+        if len(buffer) >= batch_size:
+            yield b"\n".join(buffer) + b"\n"
+            buffer = []
+    if buffer:
+        yield b"\n".join(buffer) + b"\n"
+
+
+async def _json_chunks(cursor, batch_size: int, key: Optional[str], count_key: Optional[str],
+                       extra: Optional[dict]):
+    yield b"[" if key is None else b"{" + encode_json(key) + b":["
+    count = 0
+    buffer = []
+    async for doc in cursor:
+        buffer.append(encode_json(doc))
+        count += 1
+        if len(buffer) >= batch_size:
+            yield (b"," if count > len(buffer) else b"") + b",".join(buffer)
+            buffer = []
+    if buffer:
+        yield (b"," if count > len(buffer) else b"") + b",".join(buffer)
+    if key is None:
+        yield b"]"
+        return
+    # Trailing fields are written after the array, once the count is known
+    trailer = dict(extra or {})
+    if count_key:
+        trailer[count_key] = count
+    yield b"]" + b"".join(b"," + encode_json(k) + b":" + encode_json(v) for k, v in trailer.items()) + b"}"
+
+
+def stream_cursor(cursor, mode: str, key: Optional[str] = None, count_key: Optional[str] = None,
+                  extra: Optional[dict] = None, batch_size: int = STREAM_BATCH_SIZE) -> StreamingResponse:
+    """Stream a Motor cursor as NDJSON, or as a JSON array optionally wrapped in {key: [...], ...}"""
+    cursor = cursor.batch_size(batch_size)
+    if mode == "ndjson":
+        return StreamingResponse(_ndjson_chunks(cursor, batch_size), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(
+        _json_chunks(cursor, batch_size, key, count_key, extra),
+        media_type="application/json"
+    )
@@ -1,23 +1,20 @@
 """Teacher management endpoints for student tracking and subscription management"""
-from fastapi import APIRouter, Request, HTTPException
-from typing import List
+from fastapi import APIRouter, Request, HTTPException, Depends
+from typing import List, Optional
 from datetime import datetime, timezone
 from models import User
-from auth import require_teacher, require_super_admin
-import os
-from motor.motor_asyncio import AsyncIOMotorClient
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from auth import require_teacher, require_super_admin, invalidate_cached_user
+from database import get_db
+from loader import get_loaders
+from token_versions import token_versions
+from streaming import stream_mode, stream_cursor
 
 teacher_router = APIRouter(prefix="/teacher")
 
 # ==================== STUDENT MANAGEMENT ====================
 
 @teacher_router.get("/my-students")
-async def get_my_students(request: Request):
+async def get_my_students(request: Request, db = Depends(get_db), loaders = Depends(get_loaders)):
     """Get all students assigned to this teacher"""
     teacher = await require_teacher(request)
     
@@ -27,27 +24,21 @@ async def get_my_students(request: Request):
         {"_id": 0}
     ).to_list(1000)
     
-    # Get progress for each student
+    # Get progress counts for all students in one aggregation
+    counts = await loaders.student_progress.load_many(s["user_id"] for s in students)
     student_data = []
-    for student in students:
-        # Get student's progress
-        progress_count = await db.user_progress.count_documents({"user_id": student["user_id"]})
-        mastered_count = await db.user_progress.count_documents({
-            "user_id": student["user_id"],
-            "mastery": {"$gte": 80}
-        })
-        
+    for student, count in zip(students, counts):
         student_data.append({
             **student,
-            "total_words_studied": progress_count,
-            "mastered_words": mastered_count,
+            "total_words_studied": count["total"],
+            "mastered_words": count["mastered"],
             "last_activity": student.get("last_activity", None)
         })
     
     return student_data
 
 @teacher_router.post("/assign-student")
-async def assign_student_to_teacher(request: Request, body: dict):
+async def assign_student_to_teacher(request: Request, body: dict, db = Depends(get_db)):
     """Assign a student to teacher by email"""
     teacher = await require_teacher(request)
     student_email = body.get("student_email")
@@ -73,7 +64,7 @@ async def assign_student_to_teacher(request: Request, body: dict):
     return {"message": "Student assigned successfully", "student": student}
 
 @teacher_router.post("/grant-premium/{student_id}")
-async def grant_premium_to_student(request: Request, student_id: str, body: dict):
+async def grant_premium_to_student(request: Request, student_id: str, body: dict, db = Depends(get_db)):
     """Grant premium subscription to a student (Teacher/Admin only)"""
     teacher = await require_teacher(request)
     
@@ -106,6 +97,8 @@ async def grant_premium_to_student(request: Request, student_id: str, body: dict
             }
         }
     )
+    invalidate_cached_user(student_id)
+    await token_versions.bump(db, student_id)
     
     return {
         "message": f"{subscription_type.upper()} granted successfully",
@@ -114,7 +107,8 @@ async def grant_premium_to_student(request: Request, student_id: str, body: dict
     }
 
 @teacher_router.get("/student-progress/{student_id}")
-async def get_student_detailed_progress(request: Request, student_id: str):
+async def get_student_detailed_progress(request: Request, student_id: str, db = Depends(get_db),
+                                        loaders = Depends(get_loaders)):
     """Get detailed progress for a specific student"""
     teacher = await require_teacher(request)
     
@@ -134,12 +128,14 @@ async def get_student_detailed_progress(request: Request, student_id: str):
         {"_id": 0}
     ).to_list(10000)
     
-    # Get words for each progress
+    # Get words and their categories, one batch each
+    words = await loaders.words.load_many(p["word_id"] for p in all_progress)
+    category_ids = list({w["category_id"] for w in words if w})
+    categories = dict(zip(category_ids, await loaders.categories.load_many(category_ids)))
     progress_with_words = []
-    for prog in all_progress:
-        word = await db.words.find_one({"word_id": prog["word_id"]}, {"_id": 0})
+    for prog, word in zip(all_progress, words):
         if word:
-            category = await db.categories.find_one({"category_id": word["category_id"]}, {"_id": 0})
+            category = categories[word["category_id"]]
             progress_with_words.append({
                 **prog,
                 "word": word,
@@ -160,9 +156,11 @@ async def get_student_detailed_progress(request: Request, student_id: str):
             }
         
         category_stats[cat_id]["total_words"] += 1
-        if item["mastery"] >= 80:
+        # Cards not yet migrated to schema_version 2 may lack mastery
+        mastery = item.get("mastery") or 0
+        if mastery >= 80:
             category_stats[cat_id]["mastered"] += 1
-        elif item["mastery"] >= 40:
+        elif mastery >= 40:
             category_stats[cat_id]["in_progress"] += 1
     
     return {
@@ -173,7 +171,7 @@ async def get_student_detailed_progress(request: Request, student_id: str):
     }
 
 @teacher_router.get("/dashboard-stats")
-async def get_teacher_dashboard_stats(request: Request):
+async def get_teacher_dashboard_stats(request: Request, db = Depends(get_db)):
     """Get teacher dashboard statistics"""
     teacher = await require_teacher(request)
     
@@ -208,7 +206,7 @@ async def get_teacher_dashboard_stats(request: Request):
 # ==================== ADMIN ENDPOINTS ====================
 
 @teacher_router.get("/all-teachers")
-async def get_all_teachers(request: Request):
+async def get_all_teachers(request: Request, db = Depends(get_db)):
     """Get all teachers (Admin only)"""
     await require_super_admin(request)
     
@@ -220,10 +218,14 @@ async def get_all_teachers(request: Request):
     return teachers
 
 @teacher_router.get("/all-students")
-async def get_all_students_admin(request: Request):
+async def get_all_students_admin(request: Request, stream: Optional[str] = None, db = Depends(get_db)):
     """Get all students (Admin only)"""
     await require_super_admin(request)
     
+    mode = stream_mode(request, stream)
+    if mode:
+        return stream_cursor(db.users.find({"role": "student"}, {"_id": 0}), mode)
+    
     students = await db.users.find(
         {"role": "student"},
         {"_id": 0}
@@ -0,0 +1,50 @@
+"""cache.py: LRUTTLCache eviction, tags and counters"""
+from cache import LRUTTLCache
+
+
+def test_get_set_counts_hits_and_misses():
+    cache = LRUTTLCache(maxsize=10, ttl=60)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+
+
+def test_lru_eviction():
+    cache = LRUTTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_pop_tag_drops_every_entry_of_the_tag():
+    cache = LRUTTLCache(maxsize=10, ttl=60)
+    cache.set("alice@x", "jwt", tag="u1")
+    cache.set("session-1", "cookie", tag="u1")
+    cache.set("bob@x", "jwt", tag="u2")
+    cache.pop_tag("u1")
+    assert cache.get("alice@x") is None and cache.get("session-1") is None
+    assert cache.get("bob@x") == "jwt"
+    assert cache.stats()["invalidations"] == 2
+
+
+def test_pop_tag_spares_keys_retagged_since():
+    cache = LRUTTLCache(maxsize=10, ttl=60)
+    cache.set("k", "old", tag="u1")
+    cache.set("k", "new", tag="u2")
+    cache.pop_tag("u1")
+    assert cache.get("k") == "new"
+
+
+def test_tag_index_rebuilt_after_evictions():
+    cache = LRUTTLCache(maxsize=2, ttl=60)
+    for i in range(10):
+        cache.set(f"k{i}", i, tag=f"u{i}")
+    # Evicted keys no longer linger in the tag index
+    assert cache._tagged_keys <= 2 * 2 + 1
+    cache.pop_tag("u9")
+    assert cache.get("k9") is None and cache.get("k8") == 8
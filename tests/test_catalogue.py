@@ -0,0 +1,126 @@
+"""catalogue.py: versioned category cache, ETags and 304s"""
+import asyncio
+import pytest
+from starlette.requests import Request
+from mongomock_motor import AsyncMongoMockClient
+import catalogue as catalogue_module
+from catalogue import Catalogue, categories_response
+
+
+def request(**headers) -> Request:
+    return Request({"type": "http", "headers": [
+        (name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()
+    ]})
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient().db
+
+
+@pytest.fixture
+def catalogue(monkeypatch):
+    fresh = Catalogue()
+    monkeypatch.setattr(catalogue_module, "catalogue", fresh)
+    return fresh
+
+
+def test_categories_cached_until_bump(db, catalogue):
+    async def run():
+        await db.categories.insert_one({"category_id": "c1", "name_tr": "a"})
+        first = await catalogue.categories(db)
+        await db.categories.insert_one({"category_id": "c2", "name_tr": "b"})
+        cached = await catalogue.categories(db)
+        await catalogue.bump(db, category_ids=["c2"])
+        fresh = await catalogue.categories(db)
+        return first, cached, fresh
+
+    first, cached, fresh = asyncio.run(run())
+    assert cached is first
+    assert fresh.version == first.version + 1
+    assert fresh.etag != first.etag
+    assert b"c2" in fresh.body
+    assert (catalogue.hits, catalogue.misses) == (1, 2)
+
+
+def test_categories_etag_and_304(db, catalogue):
+    async def run():
+        await db.categories.insert_one({"category_id": "c1"})
+        full = await categories_response(request(), db)
+        etag = full.headers["etag"]
+        revalidated = await categories_response(request(if_none_match=f'"other", {etag}'), db)
+        await catalogue.bump(db)
+        changed = await categories_response(request(if_none_match=etag), db)
+        return full, revalidated, changed
+
+    full, revalidated, changed = asyncio.run(run())
+    assert full.status_code == 200 and full.headers["cache-control"] == "no-cache"
+    assert revalidated.status_code == 304 and revalidated.body == b""
+    assert revalidated.headers["etag"] == full.headers["etag"]
+    assert changed.status_code == 200
+    assert catalogue.not_modified == 1
+
+
+def insert_words(db, count: int, category_id: str = "c1"):
+    return db.words.insert_many([
+        {"category_id": category_id, "word_id": f"w{i:03d}", "turkish": "kelime " * 10, "russian": "слово " * 10}
+        for i in range(count)
+    ])
+
+
+def test_word_page_encodings_have_own_etags(db, catalogue):
+    async def run():
+        await insert_words(db, 20)
+        return {
+            encoding: await catalogue_module.word_page_response(request(accept_encoding=encoding), db, "c1", None, 20)
+            for encoding in ("br, gzip", "gzip", "identity", "gzip;q=0")
+        }
+
+    responses = asyncio.run(run())
+    assert responses["br, gzip"].headers["content-encoding"] == "br"
+    assert responses["gzip"].headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in responses["identity"].headers
+    assert "content-encoding" not in responses["gzip;q=0"].headers
+    etags = {encoding: response.headers["etag"] for encoding, response in responses.items()}
+    assert etags["br, gzip"].endswith('-br"') and etags["gzip"].endswith('-gzip"')
+    assert len({etags["br, gzip"], etags["gzip"], etags["identity"]}) == 3
+    assert all(response.headers["vary"] == "Accept-Encoding" for response in responses.values())
+
+
+def test_word_page_304_per_encoding(db, catalogue):
+    async def run():
+        await insert_words(db, 20)
+        gzipped = await catalogue_module.word_page_response(request(accept_encoding="gzip"), db, "c1", None, 20)
+        etag = gzipped.headers["etag"]
+        same = await catalogue_module.word_page_response(
+            request(accept_encoding="gzip", if_none_match=etag), db, "c1", None, 20)
+        # A gzip validator does not match the identity representation
+        other = await catalogue_module.word_page_response(request(if_none_match=etag), db, "c1", None, 20)
+        return same, other
+
+    same, other = asyncio.run(run())
+    assert same.status_code == 304 and same.headers["vary"] == "Accept-Encoding"
+    assert other.status_code == 200
+
+
+def test_small_word_page_is_not_compressed(db, catalogue):
+    async def run():
+        await db.words.insert_one({"category_id": "c1", "word_id": "w1"})
+        return await catalogue_module.word_page_response(request(accept_encoding="gzip"), db, "c1", None, 20)
+
+    assert "content-encoding" not in asyncio.run(run()).headers
+
+
+def test_concurrent_word_page_misses_build_once(db, catalogue, monkeypatch):
+    calls = []
+    compress = catalogue_module.compress_variants
+    monkeypatch.setattr(catalogue_module, "compress_variants", lambda body: calls.append(1) or compress(body))
+
+    async def run():
+        await insert_words(db, 50)
+        return await asyncio.gather(*(catalogue.word_page(db, "c1", None, 50) for _ in range(10)))
+
+    pages = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(page is pages[0] for page in pages)
+    assert catalogue.coalesced == 9
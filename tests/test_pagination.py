@@ -0,0 +1,71 @@
+"""pagination.py: cursors, keyset filters and pages"""
+import asyncio
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+from pagination import (WORD_KEYSET, clamp_page_size, decode_cursor, encode_cursor, keyset_filter,
+                        keyset_page, WORDS_MAX_PAGE_SIZE, WORDS_PAGE_SIZE)
+
+
+def test_cursor_round_trip():
+    values = ["cat_ğüş", "word_1"]
+    cursor = encode_cursor(values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 2) == values
+
+
+@pytest.mark.parametrize("cursor", ["%%%", encode_cursor(["only one"]), encode_cursor({"a": 1}), "bm90IGpzb24"])
+def test_bad_cursor_is_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, 2)
+    assert e.value.status_code == 400
+
+
+def test_keyset_filter_branches():
+    assert keyset_filter(["a", "b", "c"], [1, 2, 3]) == {"$or": [
+        {"a": {"$gt": 1}},
+        {"a": 1, "b": {"$gt": 2}},
+        {"a": 1, "b": 2, "c": {"$gt": 3}},
+    ]}
+
+
+def test_clamp_page_size():
+    assert clamp_page_size(None) == WORDS_PAGE_SIZE
+    assert clamp_page_size(0) == 1
+    assert clamp_page_size(10 ** 6) == WORDS_MAX_PAGE_SIZE
+
+
+def test_pages_cover_collection_once():
+    async def walk():
+        words = AsyncMongoMockClient().db.words
+        await words.insert_many([
+            {"category_id": f"c{i % 3}", "word_id": f"w{i:02d}"} for i in range(20)
+        ])
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = await keyset_page(words, {}, WORD_KEYSET, 6, cursor, {"_id": 0})
+            pages += 1
+            seen += [(w["category_id"], w["word_id"]) for w in page["items"]]
+            if not page["has_more"]:
+                assert page["next_cursor"] is None
+                return seen, pages
+            cursor = page["next_cursor"]
+
+    seen, pages = asyncio.run(walk())
+    assert seen == sorted(seen)
+    assert len(set(seen)) == 20
+    assert pages == 4
+
+
+def test_page_within_query():
+    async def first_page():
+        words = AsyncMongoMockClient().db.words
+        await words.insert_many([{"category_id": c, "word_id": f"w{i}"} for c in "ab" for i in range(3)])
+        page = await keyset_page(words, {"category_id": "b"}, WORD_KEYSET, 2, None, {"_id": 0})
+        rest = await keyset_page(words, {"category_id": "b"}, WORD_KEYSET, 2, page["next_cursor"], {"_id": 0})
+        return page, rest
+
+    page, rest = asyncio.run(first_page())
+    assert [w["word_id"] for w in page["items"]] == ["w0", "w1"]
+    assert [w["word_id"] for w in rest["items"]] == ["w2"]
+    assert not rest["has_more"]
@@ -0,0 +1,148 @@
+"""progress.py /batch: per-item statuses, compare-and-set conflicts and the words_learned delta"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from starlette.requests import Request
+import loader
+import progress
+from dictionary import DictionarySnapshot
+from loader import RequestLoaders
+from models import BatchReviewRequest, User
+
+NOW = datetime.now(timezone.utc)
+USER = User(user_id="u1", email="u1@example.com", name="U", created_at=NOW)
+
+
+class RacingCollection:
+    """user_progress whose bulk_write runs `race` first, like a review landing mid-batch"""
+
+    def __init__(self, collection, race):
+        self._collection = collection
+        self._race = race
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def bulk_write(self, operations, **kwargs):
+        await self._race(self._collection)
+        return await self._collection.bulk_write(operations, **kwargs)
+
+
+class RacingDb:
+    def __init__(self, db, race):
+        self._db = db
+        self.user_progress = RacingCollection(db.user_progress, race)
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    async def require_auth(request):
+        return USER
+
+    monkeypatch.setattr(progress, "require_auth", require_auth)
+    monkeypatch.setattr(loader, "dictionary", DictionarySnapshot())
+    return AsyncMongoMockClient().db
+
+
+async def setup(db, learned_cards=()):
+    await db.user_progress.create_index([("user_id", 1), ("word_id", 1)], unique=True)
+    await db.words.insert_many([{"word_id": f"w{i}", "category_id": "c1"} for i in range(1, 4)])
+    await db.users.insert_one({**USER.model_dump(), "created_at": NOW.replace(tzinfo=None),
+                               "words_learned": len(learned_cards)})
+    for word_id in learned_cards:
+        await db.user_progress.insert_one({
+            "user_id": "u1", "word_id": word_id, "category_id": "c1", "interval_days": 40.0,
+            "stability": 40.0, "repetitions": 4, "review_count": 4, "learned": True,
+            "last_reviewed": (NOW - timedelta(days=40)).replace(tzinfo=None)
+        })
+
+
+async def submit(db, *reviews):
+    batch = BatchReviewRequest(reviews=[{"word_id": w, "correct": c} for w, c in reviews])
+    return await progress.submit_review_batch(Request({"type": "http", "headers": []}), batch, db, RequestLoaders(db))
+
+
+def test_duplicate_word_ids_are_reviewed_in_order(db):
+    async def run():
+        await setup(db)
+        response = await submit(db, ("w1", True), ("w1", True), ("w1", False), ("w2", True))
+        return response, await db.user_progress.find_one({"word_id": "w1"})
+
+    response, card = asyncio.run(run())
+    assert response["applied"] == 4
+    assert [r["status"] for r in response["results"]] == ["applied"] * 4
+    assert card["review_count"] == 3
+    assert (card["correct_count"], card["incorrect_count"]) == (2, 1)
+
+
+def test_unknown_words_are_not_found(db):
+    async def run():
+        await setup(db)
+        response = await submit(db, ("w1", True), ("nope", True))
+        return response, await db.user_progress.count_documents({"word_id": "nope"})
+
+    response, stored = asyncio.run(run())
+    assert [r["status"] for r in response["results"]] == ["applied", "not_found"]
+    assert response["applied"] == 1
+    assert stored == 0
+
+
+def test_card_reviewed_concurrently_is_retried(db):
+    raced = []
+
+    async def race(collection):
+        # One concurrent review between the batch's read and its first write
+        if not raced:
+            raced.append(1)
+            await collection.update_one({"word_id": "w1"}, {"$inc": {"review_count": 1}})
+
+    async def run():
+        await setup(db, learned_cards=["w1"])
+        response = await submit(RacingDb(db, race), ("w1", True))
+        return response, await db.user_progress.find_one({"word_id": "w1"})
+
+    response, card = asyncio.run(run())
+    assert response["results"][0]["status"] == "applied"
+    # Re-read after the conflict, so the concurrent review is kept
+    assert card["review_count"] == 6
+
+
+def test_card_that_keeps_changing_is_a_conflict(db):
+    async def race(collection):
+        await collection.update_one({"word_id": "w1"}, {"$inc": {"review_count": 1}})
+
+    async def run():
+        await setup(db, learned_cards=["w1"])
+        response = await submit(RacingDb(db, race), ("w1", False), ("w2", True))
+        return response, await db.user_progress.find_one({"word_id": "w1"}), await db.users.find_one({"user_id": "u1"})
+
+    response, card, user = asyncio.run(run())
+    assert [r["status"] for r in response["results"]] == ["conflict", "applied"]
+    assert card["learned"] is True
+    # The failed write's learned -> not learned crossing is not counted
+    assert "words_learned" not in response
+    assert user["words_learned"] == 1
+
+
+def test_words_learned_moves_by_the_crossings(db):
+    async def run():
+        await setup(db, learned_cards=["w1", "w2"])
+        response = await submit(db, ("w1", False), ("w2", True), ("w3", True))
+        return response, await db.users.find_one({"user_id": "u1"})
+
+    response, user = asyncio.run(run())
+    assert [r["learned"] for r in response["results"]] == [False, True, False]
+    assert response["words_learned"] == 1
+    assert user["words_learned"] == 1
+
+
+def test_words_learned_omitted_without_crossing(db):
+    async def run():
+        await setup(db)
+        return await submit(db, ("w1", True), ("w2", False))
+
+    assert "words_learned" not in asyncio.run(run())
@@ -0,0 +1,50 @@
+"""rate_limit.py: token bucket admission and refill"""
+import asyncio
+import pytest
+from fastapi import HTTPException
+import rate_limit
+from rate_limit import TokenBucketLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_reject(clock):
+    limiter = TokenBucketLimiter("t", burst=3, rate=1)
+    assert [limiter.try_acquire("a") for _ in range(4)] == [True, True, True, False]
+    # Buckets are per key
+    assert limiter.try_acquire("b")
+    assert (limiter.admitted, limiter.rejected) == (4, 1)
+
+
+def test_refill_rate(clock):
+    limiter = TokenBucketLimiter("t", burst=2, rate=0.5)
+    assert limiter.try_acquire("a") and limiter.try_acquire("a")
+    clock[0] += 1
+    assert not limiter.try_acquire("a")  # half a token so far
+    clock[0] += 1
+    assert limiter.try_acquire("a")
+    assert not limiter.try_acquire("a")
+
+
+def test_refill_capped_at_burst(clock):
+    limiter = TokenBucketLimiter("t", burst=2, rate=1)
+    limiter.try_acquire("a")
+    clock[0] += 3600
+    assert [limiter.try_acquire("a") for _ in range(3)] == [True, True, False]
+
+
+def test_admit_login_raises_429(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "LOGIN_LIMIT_SHARED", False)
+    monkeypatch.setattr(rate_limit, "login_ip_limiter", TokenBucketLimiter("ip", burst=10, rate=1))
+    monkeypatch.setattr(rate_limit, "login_email_limiter", TokenBucketLimiter("email", burst=1, rate=0.1))
+    asyncio.run(rate_limit.admit_login(None, "A@x.co ", "10.0.0.1"))
+    with pytest.raises(HTTPException) as e:
+        # Same bucket: emails are normalized
+        asyncio.run(rate_limit.admit_login(None, "a@x.co", "10.0.0.2"))
+    assert e.value.status_code == 429
+    assert e.value.headers["Retry-After"] == "10"
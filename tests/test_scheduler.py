@@ -0,0 +1,139 @@
+"""scheduler.py: NumPy / pipeline parity, reference values and legacy cards"""
+import random
+from datetime import datetime, timedelta, timezone
+import mongomock
+import pytest
+import scheduler
+from review import learned_delta
+from scheduler import FSRSScheduler, SM2Scheduler, STATE_FIELDS, card_state
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+LEGACY_CARDS = [
+    {},
+    {"level": 3, "learned": False, "correct_count": 3, "last_reviewed": datetime(2025, 12, 25)},
+    {"mastery": 40, "interval_days": 8, "last_reviewed": datetime(2025, 12, 20)},
+]
+
+
+def stored(value):
+    """Datetimes as MongoDB returns them: naive UTC"""
+    if isinstance(value, dict):
+        return {k: stored(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [stored(v) for v in value]
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def run_pipeline(card: dict, stages: list) -> dict:
+    """Evaluate update-pipeline stages on one card with mongomock"""
+    collection = mongomock.MongoClient().db.cards
+    collection.insert_one(stored(card))
+    return collection.aggregate([{"$project": {"_id": 0}}, *stages]).next()
+
+
+def pipeline_review(sched, card: dict, correct: bool, now: datetime) -> dict:
+    # next_review is left out: mongomock cannot add milliseconds to a date
+    derived = {k: v for k, v in scheduler._derived_exprs(now, correct).items() if k != "next_review"}
+    stages = [*scheduler._state_exprs(now), *sched.pipeline_stages(correct), {"$set": derived}]
+    return run_pipeline(card, stored(stages))
+
+
+def review(sched, card: dict, correct: bool, now: datetime) -> dict:
+    return sched.review_cards([card], [correct], [now])[0]
+
+
+@pytest.mark.parametrize("sched", [SM2Scheduler(), FSRSScheduler()], ids=lambda s: s.name)
+@pytest.mark.parametrize("legacy", LEGACY_CARDS, ids=["new", "level", "mastery"])
+def test_pipeline_matches_numpy(sched, legacy):
+    rng = random.Random(7)
+    card = {"user_id": "u", "word_id": "w", **legacy}
+    now = START
+    for _ in range(10):
+        correct = rng.random() < 0.75
+        expected = review(sched, card, correct, now)
+        actual = pipeline_review(sched, card, correct, now)
+        for field in STATE_FIELDS + ("mastery",):
+            # MongoDB keeps dates to the millisecond, so elapsed days differ in the last digits
+            assert actual[field] == pytest.approx(expected[field], rel=1e-6), field
+        assert actual["level"] == expected["level"]
+        assert actual["learned"] == expected["learned"]
+        card = expected
+        now += timedelta(days=expected["interval_days"] * rng.uniform(0.5, 1.5))
+
+
+def test_sm2_reference_values():
+    sched = SM2Scheduler()
+    card = {}
+    history = []
+    for correct in (True, True, True, True, False):
+        card = review(sched, card, correct, START)
+        history.append((card["interval_days"], card["ease"], card["repetitions"]))
+    assert history == [(1, 2.5, 1), (6, 2.5, 2), (15, 2.5, 3), (38, 2.5, 4), (1, pytest.approx(1.96), 0)]
+
+
+def test_fsrs_reference_values():
+    # FSRS-4.5 default weights, desired retention 0.9 (one day of interval per day of stability)
+    sched = FSRSScheduler(desired_retention=0.9)
+    card = review(sched, {}, True, START)
+    assert (card["interval_days"], card["stability"], card["difficulty"]) == (4, pytest.approx(3.7145), pytest.approx(5.1618))
+    card = review(sched, card, True, START + timedelta(days=4))
+    assert card["interval_days"] == 15
+    assert card["stability"] == pytest.approx(14.8081005, rel=1e-6)
+    assert card["difficulty"] == pytest.approx(5.1618)
+    card = review(sched, card, False, START + timedelta(days=19))
+    assert card["interval_days"] == 3
+    assert card["stability"] == pytest.approx(3.1493213, rel=1e-6)
+    assert card["difficulty"] == pytest.approx(6.901155)
+    assert card["repetitions"] == 0
+
+    again = review(sched, {}, False, START)
+    assert (again["interval_days"], again["stability"], again["difficulty"]) == (1, pytest.approx(0.4872), pytest.approx(7.6214))
+
+
+def test_legacy_card_state():
+    assert card_state({"level": 4}) == {
+        "interval_days": 15.0, "ease": 2.5, "stability": 15.0, "difficulty": 5.0, "repetitions": 2.0
+    }
+    assert card_state({"mastery": 40, "interval_days": 8})["repetitions"] == 2.0
+    assert card_state({})["interval_days"] == 0.0
+
+
+def test_learned_threshold_matches_old_code():
+    # Old level code: learned from level 5 (30 days); old mastery code: from mastery 50
+    for level in range(6):
+        mastery, derived_level, learned = scheduler.derive(scheduler.np.array([card_state({"level": level})["interval_days"]]))
+        assert derived_level[0] == level
+        assert learned[0] == (level >= 5)
+        assert (mastery[0] >= 50) == learned[0]
+
+
+@pytest.mark.parametrize("first, second", [(SM2Scheduler(), FSRSScheduler()), (FSRSScheduler(), SM2Scheduler())],
+                         ids=["sm2-to-fsrs", "fsrs-to-sm2"])
+def test_switching_scheduler_keeps_progress(first, second):
+    card = {}
+    now = START
+    while card.get("interval_days", 0) < 90:
+        card = review(first, card, True, now)
+        now += timedelta(days=card["interval_days"])
+    assert card["learned"]
+    switched = review(second, card, True, now)
+    assert switched["interval_days"] >= card["interval_days"]
+    assert switched["learned"]
+    # The stored form of the same review agrees
+    assert pipeline_review(second, card, True, now)["interval_days"] == switched["interval_days"]
+
+
+@pytest.mark.parametrize("sched", [SM2Scheduler(), FSRSScheduler()], ids=lambda s: s.name)
+def test_correct_review_keeps_legacy_card_learned(sched):
+    # Learned under the old mastery code, but short of the learned interval
+    card = {"mastery": 60, "interval_days": 4, "last_reviewed": START - timedelta(days=4)}
+    reviewed = review(sched, card, True, START)
+    assert reviewed["interval_days"] < scheduler.LEARNED_INTERVAL_DAYS
+    assert reviewed["learned"]
+    assert learned_delta(card, reviewed) == 0
+    assert pipeline_review(sched, card, True, START)["learned"]
+    # An incorrect answer still unlearns it
+    assert not review(sched, card, False, START)["learned"]
+    assert not pipeline_review(sched, card, False, START)["learned"]
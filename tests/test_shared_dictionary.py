@@ -0,0 +1,61 @@
+import pytest
+from shared_dictionary import CATEGORIES, CATEGORY_WORDS, WORDS, MappedSnapshot, write_snapshot
+
+WORDS_BY_ID = {
+    "w2": {"word_id": "w2", "turkish": "su", "russian": "вода"},
+    "w1": {"word_id": "w1", "turkish": "ekmek", "russian": "хлеб"},
+    "w3": {"word_id": "w3", "turkish": "çay", "russian": "чай"},
+}
+CATEGORIES_BY_ID = {"food": {"category_id": "food", "name": "Yemek"}}
+WORDS_BY_CATEGORY = {"food": ["w1", "w2", "missing"]}
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    path = str(tmp_path / "dictionary.snapshot")
+    size = write_snapshot(path, 7, WORDS_BY_ID, CATEGORIES_BY_ID, WORDS_BY_CATEGORY)
+    view = MappedSnapshot(path)
+    assert view.size == size
+    return view
+
+
+def test_round_trip(snapshot):
+    assert snapshot.version == 7
+    for word_id, word in WORDS_BY_ID.items():
+        assert snapshot.word(word_id) == word
+    assert snapshot.category("food") == CATEGORIES_BY_ID["food"]
+    # Ids without a word entry are dropped
+    assert snapshot.category_words("food") == [WORDS_BY_ID["w1"], WORDS_BY_ID["w2"]]
+
+
+def test_missing_keys(snapshot):
+    assert snapshot.word("w0") is None
+    assert snapshot.word("w4") is None
+    assert snapshot.word("") is None
+    assert snapshot.category("drink") is None
+    assert snapshot.category_words("drink") == []
+
+
+def test_items_are_sorted_by_key(snapshot):
+    assert [key for key, _ in snapshot.items(WORDS)] == ["w1", "w2", "w3"]
+    assert dict(snapshot.items(WORDS)) == WORDS_BY_ID
+    assert dict(snapshot.items(CATEGORY_WORDS)) == WORDS_BY_CATEGORY
+    assert snapshot.count(CATEGORIES) == 1
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / "empty.snapshot")
+    write_snapshot(path, 0, {}, {}, {})
+    view = MappedSnapshot(path)
+    assert view.count(WORDS) == 0
+    assert view.word("w1") is None
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other"
+    path.write_bytes(b"NOPE" + bytes(200))
+    with pytest.raises(ValueError):
+        MappedSnapshot(str(path))
+    path.write_bytes(b"YL")
+    with pytest.raises(ValueError):
+        MappedSnapshot(str(path))
@@ -0,0 +1,56 @@
+"""streaming.py: JSON and NDJSON framing"""
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from mongomock_motor import AsyncMongoMockClient
+from streaming import NDJSON_MEDIA_TYPE, stream_cursor, stream_mode
+
+
+def request(accept: str = "") -> Request:
+    return Request({"type": "http", "headers": [(b"accept", accept.encode())]})
+
+
+def body(count: int, mode: str, batch_size: int = 2, **kwargs):
+    async def run():
+        collection = AsyncMongoMockClient().db.items
+        if count:
+            await collection.insert_many([{"n": i} for i in range(count)])
+        response = stream_cursor(collection.find({}, {"_id": 0}), mode, batch_size=batch_size, **kwargs)
+        chunks = [chunk async for chunk in response.body_iterator]
+        return response, chunks
+    return asyncio.run(run())
+
+
+def test_stream_mode():
+    assert stream_mode(request(), None) is None
+    assert stream_mode(request(NDJSON_MEDIA_TYPE), None) == "ndjson"
+    assert stream_mode(request(NDJSON_MEDIA_TYPE), "json") == "json"
+    with pytest.raises(HTTPException) as e:
+        stream_mode(request(), "xml")
+    assert e.value.status_code == 400
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 5])
+def test_json_array(count):
+    response, chunks = body(count, "json")
+    assert response.media_type == "application/json"
+    assert json.loads(b"".join(chunks)) == [{"n": i} for i in range(count)]
+
+
+@pytest.mark.parametrize("count", [0, 3, 4])
+def test_json_wrapped_with_trailer(count):
+    _, chunks = body(count, "json", key="words", count_key="count", extra={"page": 1})
+    assert json.loads(b"".join(chunks)) == {"words": [{"n": i} for i in range(count)], "page": 1, "count": count}
+
+
+@pytest.mark.parametrize("count", [0, 1, 5])
+def test_ndjson_lines(count):
+    response, chunks = body(count, "ndjson")
+    assert response.media_type == NDJSON_MEDIA_TYPE
+    data = b"".join(chunks)
+    assert data.endswith(b"\n") or count == 0
+    assert [json.loads(line) for line in data.splitlines()] == [{"n": i} for i in range(count)]
+    # One chunk per batch of documents
+    assert len(chunks) == (count + 1) // 2
@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from words_learned import RECONCILE_LEASE_ID, WordsLearnedReconciler
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient().db
+
+
+def reconciler(owner: str) -> WordsLearnedReconciler:
+    r = WordsLearnedReconciler()
+    r.owner = owner
+    return r
+
+
+def test_one_worker_holds_the_lease(db):
+    a, b = reconciler("host:1"), reconciler("host:2")
+
+    async def run():
+        return [await a.acquire_lease(db), await b.acquire_lease(db), await a.acquire_lease(db)]
+
+    assert asyncio.run(run()) == [True, False, True]
+
+
+def test_expired_lease_is_taken_over(db):
+    a, b = reconciler("host:1"), reconciler("host:2")
+
+    async def run():
+        await a.acquire_lease(db)
+        await db.migrations.update_one({"_id": RECONCILE_LEASE_ID},
+                                       {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}})
+        taken = await b.acquire_lease(db)
+        return taken, await a.acquire_lease(db), (await db.migrations.find_one({"_id": RECONCILE_LEASE_ID}))["owner"]
+
+    assert asyncio.run(run()) == (True, False, "host:2")
@@ -0,0 +1,83 @@
+"""Per-user JWT claim versions for YLM Sözlük
+
+Tokens carry role and subscription claims stamped with the user's version.
+Only users whose role or subscription was changed by an admin have an
+entry, so the whole map stays small enough to hold in every worker.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from pymongo import ReturnDocument
+from database import MongoDatabase
+
+logger = logging.getLogger(__name__)
+
+# How quickly a bump made by one worker reaches the others
+TOKEN_VERSION_REFRESH_SECONDS = float(os.environ.get("TOKEN_VERSION_REFRESH_SECONDS", "5"))
+
+
+class TokenVersionMap:
+    """user_id -> claim version, mirrored from the token_versions collection"""
+
+    def __init__(self):
+        self.versions = {}
+        # Moves whenever any version changes, so readers can detect a change during an await
+        self.generation = 0
+        self._loaded_until: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def current(self, user_id: str) -> int:
+        return self.versions.get(user_id, 0)
+
+    def _set(self, user_id: str, version: int):
+        if version > self.current(user_id):
+            self.versions[user_id] = version
+            self.generation += 1
+
+    async def bump(self, db: MongoDatabase, user_id: str) -> int:
+        """Invalidate the claims of every token issued to this user so far"""
+        doc = await db.token_versions.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._set(user_id, doc["version"])
+        return doc["version"]
+
+    async def refresh(self, db: MongoDatabase):
+        """Pull versions changed since the last refresh"""
+        query = {}
+        if self._loaded_until is not None:
+            query["updated_at"] = {"$gte": self._loaded_until}
+        started = datetime.now(timezone.utc)
+        async for doc in db.token_versions.find(query, {"_id": 0, "user_id": 1, "version": 1}):
+            self._set(doc["user_id"], doc["version"])
+        # Overlap windows so writes stamped by a worker with a lagging clock are not missed
+        self._loaded_until = started - timedelta(seconds=TOKEN_VERSION_REFRESH_SECONDS)
+
+    async def _refresh_loop(self, db: MongoDatabase):
+        while True:
+            await asyncio.sleep(TOKEN_VERSION_REFRESH_SECONDS)
+            try:
+                await self.refresh(db)
+            except Exception as e:
+                logger.warning(f"Token version refresh failed: {e}")
+
+    async def start(self, db: MongoDatabase):
+        await self.refresh(db)
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"entries": len(self.versions)}
+
+
+token_versions = TokenVersionMap()
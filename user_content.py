@@ -1,38 +1,31 @@
 """User-generated content endpoints for YLM Sözlük"""
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from typing import Optional
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
 from models import Word, WordCreate, Category, CategoryCreate
-from auth import require_auth
-import os
+from auth import Principal, require_auth, require_subscription
+from database import get_db
+from streaming import stream_mode, stream_cursor
+from catalogue import catalogue
 import uuid
 
 router = APIRouter(prefix="/user-content", tags=["user-content"])
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
 
-
-def check_premium_access(user):
+async def check_premium_access(request: Request) -> Principal:
     """Check if user has premium/pro subscription"""
-    subscription = user.subscription if hasattr(user, 'subscription') else 'free'
-    if subscription not in ['premium', 'pro']:
-        raise HTTPException(
-            status_code=403,
-            detail="Bu özellik sadece premium/pro kullanıcılar için geçerlidir. Lütfen aboneliğinizi yükseltin."
-        )
+    return await require_subscription(
+        request,
+        ['premium', 'pro'],
+        "Bu özellik sadece premium/pro kullanıcılar için geçerlidir. Lütfen aboneliğinizi yükseltin."
+    )
 
 
 @router.post("/words/create")
-async def create_user_word(request: Request, word_data: dict):
+async def create_user_word(request: Request, word_data: dict, db = Depends(get_db)):
     """Create a new word (premium users only)"""
-    user = await require_auth(request)
-    
     # Check premium access
-    check_premium_access(user)
+    user = await check_premium_access(request)
     
     # Validate required fields
     required_fields = ['turkish', 'russian', 'category_id']
@@ -69,6 +62,7 @@ async def create_user_word(request: Request, word_data: dict):
         {"category_id": word_data['category_id']},
         {"$inc": {"word_count": 1}}
     )
+    await catalogue.bump(db, word_ids=[word_id], category_ids=[word_data['category_id']])
     
     return {
         "success": True,
@@ -78,15 +72,19 @@ async def create_user_word(request: Request, word_data: dict):
 
 
 @router.get("/words/my-words")
-async def get_my_words(request: Request):
+async def get_my_words(request: Request, stream: Optional[str] = None, db = Depends(get_db)):
     """Get user's own words"""
     user = await require_auth(request)
     
     # Get all words created by user
-    my_words = await db.words.find({
+    query = {
         "created_by": user.user_id,
         "user_generated": True
-    }, {"_id": 0}).to_list(10000)
+    }
+    mode = stream_mode(request, stream)
+    if mode:
+        return stream_cursor(db.words.find(query, {"_id": 0}), mode, key="words", count_key="count")
+    my_words = await db.words.find(query, {"_id": 0}).to_list(10000)
     
     return {
         "count": len(my_words),
@@ -95,7 +93,7 @@ async def get_my_words(request: Request):
 
 
 @router.put("/words/{word_id}")
-async def update_user_word(request: Request, word_id: str, word_data: dict):
+async def update_user_word(request: Request, word_id: str, word_data: dict, db = Depends(get_db)):
     """Update user's own word"""
     user = await require_auth(request)
     
@@ -121,6 +119,7 @@ async def update_user_word(request: Request, word_id: str, word_data: dict):
             {"word_id": word_id},
             {"$set": update_data}
         )
+        await catalogue.bump(db, word_ids=[word_id])
     
     return {
         "success": True,
@@ -129,7 +128,7 @@ async def update_user_word(request: Request, word_id: str, word_data: dict):
 
 
 @router.delete("/words/{word_id}")
-async def delete_user_word(request: Request, word_id: str):
+async def delete_user_word(request: Request, word_id: str, db = Depends(get_db)):
     """Delete user's own word"""
     user = await require_auth(request)
     
@@ -150,6 +149,7 @@ async def delete_user_word(request: Request, word_id: str):
         {"category_id": word.get("category_id")},
         {"$inc": {"word_count": -1}}
     )
+    await catalogue.bump(db, word_ids=[word_id], category_ids=[word.get('category_id')])
     
     return {
         "success": True,
@@ -158,12 +158,10 @@ async def delete_user_word(request: Request, word_id: str):
 
 
 @router.post("/categories/create")
-async def create_user_category(request: Request, category_data: dict):
+async def create_user_category(request: Request, category_data: dict, db = Depends(get_db)):
     """Create a new category (premium users only)"""
-    user = await require_auth(request)
-    
     # Check premium access
-    check_premium_access(user)
+    user = await check_premium_access(request)
     
     # Validate required fields
     required_fields = ['name_tr', 'name_ru']
@@ -194,6 +192,7 @@ async def create_user_category(request: Request, category_data: dict):
     }
     
     await db.categories.insert_one(new_category)
+    await catalogue.bump(db, category_ids=[category_id])
     
     return {
         "success": True,
@@ -203,7 +202,7 @@ async def create_user_category(request: Request, category_data: dict):
 
 
 @router.get("/categories/my-categories")
-async def get_my_categories(request: Request):
+async def get_my_categories(request: Request, db = Depends(get_db)):
     """Get user's own categories"""
     user = await require_auth(request)
     
@@ -220,7 +219,7 @@ async def get_my_categories(request: Request):
 
 
 @router.delete("/categories/{category_id}")
-async def delete_user_category(request: Request, category_id: str):
+async def delete_user_category(request: Request, category_id: str, db = Depends(get_db)):
     """Delete user's own category (and all its words)"""
     user = await require_auth(request)
     
@@ -241,6 +240,7 @@ async def delete_user_category(request: Request, category_id: str):
     
     # Delete category
     await db.categories.delete_one({"category_id": category_id})
+    await catalogue.bump(db, category_ids=[category_id])
     
     return {
         "success": True,
@@ -0,0 +1,151 @@
+"""users.words_learned maintenance
+
+Reviews adjust the counter with $inc only when a card crosses the learned
+threshold, so a review no longer recounts the user's progress. A periodic
+reconciliation recounts in batches and corrects any drift; run it by hand
+with `python words_learned.py`. In the server, the worker holding a lease
+document in the `migrations` collection runs it, so N workers don't all
+recount every user each interval.
+"""
+import asyncio
+import logging
+import os
+import socket
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from auth import invalidate_cached_user
+from database import MongoDatabase, get_mongo, close_mongo_connection
+from models import User
+from review import LEARNED_QUERY
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the background job
+WORDS_LEARNED_RECONCILE_SECONDS = float(os.environ.get("WORDS_LEARNED_RECONCILE_SECONDS", "3600"))
+RECONCILE_BATCH_SIZE = int(os.environ.get("WORDS_LEARNED_RECONCILE_BATCH_SIZE", "500"))
+RECONCILE_LEASE_ID = "words_learned_reconcile"
+
+
+async def adjust_words_learned(db: MongoDatabase, user: User, delta: int) -> Optional[int]:
+    """Apply a threshold crossing to the user's counter; returns the stored count, or None without a crossing"""
+    if delta == 0:
+        # The cached User may be stale, and reading the count would cost the round trip we avoid
+        return None
+    doc = await db.users.find_one_and_update(
+        {"user_id": user.user_id},
+        {"$inc": {"words_learned": delta}},
+        {"_id": 0, "words_learned": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_cached_user(user.user_id)
+    return doc["words_learned"] if doc else None
+
+
+async def reconcile_words_learned(db: MongoDatabase, batch_size: int = RECONCILE_BATCH_SIZE) -> dict:
+    """Recount learned cards per user and fix counters that drifted"""
+    checked = corrected = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        users = await db.users.find(query, {"user_id": 1, "words_learned": 1}).sort("_id", 1).to_list(batch_size)
+        if not users:
+            break
+        last_id = users[-1]["_id"]
+        user_ids = [u["user_id"] for u in users if u.get("user_id")]
+        # Count right before writing so the window for racing reviews stays small
+        counts = {row["_id"]: row["count"] for row in await db.user_progress.aggregate([
+            {"$match": {"user_id": {"$in": user_ids}, **LEARNED_QUERY}},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+        ]).to_list(None)}
+        fixes = []
+        drifted = []
+        for u in users:
+            actual = counts.get(u.get("user_id"), 0)
+            if u.get("words_learned", 0) != actual:
+                # Only overwrite the value we read; a concurrent $inc wins
+                fixes.append(UpdateOne(
+                    {"_id": u["_id"], "words_learned": u.get("words_learned")},
+                    {"$set": {"words_learned": actual}}
+                ))
+                drifted.append(u.get("user_id"))
+        if fixes:
+            result = await db.users.bulk_write(fixes, ordered=False)
+            corrected += result.modified_count
+            # Only users whose count was rewritten have a stale cached copy
+            for user_id in drifted:
+                invalidate_cached_user(user_id)
+        checked += len(users)
+    return {"users_checked": checked, "users_corrected": corrected}
+
+
+class WordsLearnedReconciler:
+    """Runs reconcile_words_learned every WORDS_LEARNED_RECONCILE_SECONDS"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.runs = 0
+        self.skipped = 0
+        self.corrected = 0
+
+    async def acquire_lease(self, db: MongoDatabase) -> bool:
+        """Take or renew the lease for one interval; False while another worker holds it"""
+        now = datetime.now(timezone.utc)
+        try:
+            await db.migrations.update_one(
+                {"_id": RECONCILE_LEASE_ID, "$or": [{"expires_at": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "acquired_at": now,
+                          "expires_at": now + timedelta(seconds=WORDS_LEARNED_RECONCILE_SECONDS)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The lease exists, is unexpired and belongs to another worker
+            return False
+        return True
+
+    async def _loop(self, db: MongoDatabase):
+        while True:
+            await asyncio.sleep(WORDS_LEARNED_RECONCILE_SECONDS)
+            try:
+                if not await self.acquire_lease(db):
+                    self.skipped += 1
+                    continue
+                report = await reconcile_words_learned(db)
+                self.runs += 1
+                self.corrected += report["users_corrected"]
+                if report["users_corrected"]:
+                    logger.info(f"words_learned reconciled: {report}")
+            except Exception as e:
+                logger.warning(f"words_learned reconciliation failed: {e}")
+
+    async def start(self, db: MongoDatabase):
+        if WORDS_LEARNED_RECONCILE_SECONDS > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"runs": self.runs, "skipped": self.skipped, "users_corrected": self.corrected}
+
+
+words_learned_reconciler = WordsLearnedReconciler()
+
+
+async def _main() -> int:
+    db = get_mongo()
+    try:
+        print(await reconcile_words_learned(db))
+    finally:
+        close_mongo_connection()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))